@@ -0,0 +1,125 @@
+# Cache of question_and_answer results in front of the Pinecone Assistant.
+#
+# Questions are normalized (case, punctuation, whitespace) and looked up by
+# exact match first. Optionally, a small local similarity index built from
+# character trigrams catches rephrasings of a cached question. Entries expire
+# after a TTL and the least recently used entries are evicted past the size cap.
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1000))
+# Minimum cosine similarity for a fuzzy hit, between 0 and 1 (0 disables it)
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    text = _PUNCTUATION.sub(' ', (question or '').lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _embed(text):
+    # Unit-length character trigram frequency vector
+    padded = f" {text} "
+    counts = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    if not norm:
+        return {}
+    return {trigram: count / norm for trigram, count in counts.items()}
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(trigram, 0.0) for trigram, weight in a.items())
+
+
+class _Entry:
+    __slots__ = ('answer', 'expires_at', 'vector')
+
+    def __init__(self, answer, expires_at, vector):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.vector = vector
+
+
+class AnswerCache:
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES, similarity=ANSWER_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question):
+        key = normalize_question(question)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+            del self._entries[key]
+
+        if self.similarity > 0:
+            match = self._find_similar(key, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.similar_hits += 1
+                return self._entries[match].answer
+
+        self.misses += 1
+        return None
+
+    def put(self, question, answer):
+        key = normalize_question(question)
+        vector = _embed(key) if self.similarity > 0 else None
+        self._entries[key] = _Entry(answer, time.monotonic() + self.ttl, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, question=None):
+        if question is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+        return 1 if self._entries.pop(normalize_question(question), None) else 0
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "similarHits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": (self.hits + self.similar_hits) / lookups if lookups else 0.0
+        }
+
+    def _find_similar(self, key, now):
+        vector = _embed(key)
+        best_key, best_score = None, self.similarity
+        for candidate, entry in self._entries.items():
+            if entry.expires_at <= now or entry.vector is None:
+                continue
+            score = _cosine(vector, entry.vector)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+
+answer_cache = AnswerCache()
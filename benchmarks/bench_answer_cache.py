@@ -0,0 +1,95 @@
+# Benchmark: time-to-first-audio after a question_and_answer tool call with a
+# cold and a warm answer cache.
+#
+# The Pinecone Assistant is replaced with a local stand-in that streams its
+# answer in chunks with a configurable delay, and the Realtime model is
+# modelled as a fixed delay between response.create and the first
+# response.audio.delta. The measured part is the real cache + rag code path.
+#
+# Usage: python benchmarks/bench_answer_cache.py [--questions 20] [--rag-latency 1.5]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+
+QUESTIONS = [
+    "What is an AI employee?",
+    "How much does a voice agent cost?",
+    "Can your agents book appointments into my calendar?",
+    "Do you integrate with Salesforce?",
+    "How long does it take to set up an AI receptionist?",
+    "Which languages do your voice agents speak?",
+    "Is my customer data stored securely?",
+    "Can I try a demo before buying?",
+]
+
+
+class FakeAssistant:
+    def __init__(self, latency, chunks=8):
+        self.latency = latency
+        self.chunks = chunks
+
+    def chat(self, messages, stream=True):  # noqa: ARG002 - rag.py passes both by keyword
+        question = messages[0].content
+        for i in range(self.chunks):
+            time.sleep(self.latency / self.chunks)
+            yield SimpleNamespace(type="content_chunk", delta=SimpleNamespace(content=f"[{question} part {i}] "))
+
+
+async def time_to_first_audio(cache, question, model_latency):
+    started = time.perf_counter()
+    answer_message = cache.get(question)
+    if answer_message is None:
+        answer_message = await rag.answer_question(question)
+        cache.put(question, answer_message)
+    # response.create would be sent here; model time to first audio delta
+    await asyncio.sleep(model_latency)
+    return time.perf_counter() - started
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<6} n={len(samples):<4} mean={statistics.mean(samples) * 1000:8.1f} ms  "
+          f"p50={statistics.median(samples) * 1000:8.1f} ms  p95={p95 * 1000:8.1f} ms")
+
+
+async def main(args):
+    rag.set_assistant(FakeAssistant(args.rag_latency))
+    cache = AnswerCache(similarity=args.similarity)
+    questions = [QUESTIONS[i % len(QUESTIONS)] + (f" (variant {i // len(QUESTIONS)})" if i >= len(QUESTIONS) else "")
+                 for i in range(args.questions)]
+
+    cold = [await time_to_first_audio(cache, q, args.model_latency) for q in questions]
+    warm = [await time_to_first_audio(cache, q, args.model_latency) for q in questions]
+    # Same questions asked the way callers actually phrase them
+    rephrased = [await time_to_first_audio(cache, q.upper().rstrip('?') + ' ??', args.model_latency) for q in questions]
+
+    summarize("cold", cold)
+    summarize("warm", warm)
+    summarize("warm*", rephrased)
+    print("(* normalized rephrasings)  cache:", cache.stats())
+
+    lookups = 100000
+    started = time.perf_counter()
+    for i in range(lookups):
+        cache.get(questions[i % len(questions)])
+    print(f"cache lookup: {(time.perf_counter() - started) / lookups * 1e6:.2f} us")
+    rag.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--rag-latency', type=float, default=1.5, help="seconds for the stand-in assistant to stream an answer")
+    parser.add_argument('--model-latency', type=float, default=0.3, help="seconds from response.create to first audio delta")
+    parser.add_argument('--similarity', type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,145 @@
+# Micro-benchmark: audio frames relayed per second per core.
+#
+# Compares the original relay (json.loads, new dict, json.dumps) with the
+# codec fast path (peek the event type, slice out the audio, fill a template)
+# for Twilio media frames and OpenAI response.audio.delta events. main.py
+# only takes the Twilio fast path when it beats the JSON backend's parser.
+#
+# Frames are synthesized in the exact wire format Twilio and OpenAI send, or
+# read from a recording with --recording: one raw WebSocket text message per
+# line, as captured from either socket.
+#
+# Usage: python benchmarks/bench_codec.py [--frames 20000] [--recording frames.txt]
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+
+def twilio_frames(count):
+    frames = []
+    for i in range(count):
+        payload = base64.b64encode(random.randbytes(160)).decode()
+        frames.append(json.dumps({
+            "event": "media",
+            "sequenceNumber": str(i + 3),
+            "media": {"track": "inbound", "chunk": str(i + 1), "timestamp": str(i * 20), "payload": payload},
+            "streamSid": STREAM_SID
+        }, separators=(',', ':')))
+    return frames
+
+
+def openai_frames(count):
+    frames = []
+    for i in range(count):
+        # Realtime deltas carry a variable amount of audio, typically 20-200 ms
+        delta = base64.b64encode(random.randbytes(random.choice((160, 800, 1600)))).decode()
+        frames.append(json.dumps({
+            "type": "response.audio.delta",
+            "event_id": f"event_{i:020d}",
+            "response_id": "resp_AbCdEf0123456789",
+            "item_id": "item_AbCdEf0123456789",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": delta
+        }, separators=(',', ':')))
+    return frames
+
+
+def baseline_twilio(message):
+    data = json.loads(message)
+    if data.get('event') == 'media':
+        return json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+
+
+def baseline_openai(message):
+    response = json.loads(message)
+    if response.get('type') == 'response.audio.delta' and response.get('delta'):
+        return json.dumps({"event": "media", "streamSid": STREAM_SID, "media": {"payload": response['delta']}})
+
+
+def codec_parse_twilio(message):
+    data = codec.loads(message)
+    if data.get('event') == 'media':
+        return codec.openai_audio_append(data['media']['payload'])
+
+
+def codec_parse_openai(message):
+    response = codec.loads(message)
+    if response.get('type') == 'response.audio.delta' and response.get('delta'):
+        return codec.twilio_media(STREAM_SID, response['delta'])
+
+
+def fast_twilio(message):
+    if codec.peek_twilio_event(message) == 'media':
+        return codec.openai_audio_append(codec.extract_string(message, 'payload'))
+    return codec_parse_twilio(message)
+
+
+def relay_twilio(message):
+    # As main.py relays: the fast path only with the standard library parser
+    return fast_twilio(message) if codec.PEEK_TWILIO_MEDIA else codec_parse_twilio(message)
+
+
+def fast_openai(message):
+    if codec.peek_openai_type(message) == 'response.audio.delta':
+        return codec.twilio_media(STREAM_SID, codec.extract_string(message, 'delta'))
+    return codec_parse_openai(message)
+
+
+def measure(relay, frames, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        for message in frames:
+            relay(message)
+        best = min(best, time.process_time() - started)
+    return len(frames) / best
+
+
+def main(args):
+    if args.recording:
+        with open(args.recording, encoding='utf-8') as recording:
+            recorded = [line.rstrip('\n') for line in recording if line.strip()]
+        # Twilio messages carry "event", OpenAI messages carry "type"
+        incoming = [m for m in recorded if 'event' in codec.loads(m)]
+        outgoing = [m for m in recorded if 'event' not in codec.loads(m)]
+    else:
+        incoming = twilio_frames(args.frames)
+        outgoing = openai_frames(args.frames)
+
+    # Sanity check: every path produces the same messages
+    for baseline, fast in ((baseline_twilio, fast_twilio), (baseline_openai, fast_openai)):
+        for message in (incoming if baseline is baseline_twilio else outgoing)[:100]:
+            expected, actual = baseline(message), fast(message)
+            assert (expected is None and actual is None) or json.loads(expected) == json.loads(actual)
+
+    print(f"JSON backend: {codec.JSON_BACKEND}")
+    for label, frames, relays in (
+        ("Twilio media -> OpenAI", incoming, (baseline_twilio, codec_parse_twilio, fast_twilio)),
+        ("OpenAI delta -> Twilio", outgoing, (baseline_openai, codec_parse_openai, fast_openai)),
+    ):
+        if not frames:
+            continue
+        rates = [measure(relay, frames, args.repeat) for relay in relays]
+        print(f"{label}: stdlib {rates[0]:>11,.0f}/s   {codec.JSON_BACKEND} parse {rates[1]:>11,.0f}/s   "
+              f"fast path {rates[2]:>11,.0f}/s   ({rates[2] / rates[0]:.1f}x)")
+    # One call is 50 inbound frames per second plus the agent's audio
+    print(f"~ concurrent calls per core on inbound audio alone: {measure(relay_twilio, incoming, args.repeat) / 50:,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--recording')
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+# Benchmark: transcript delivery through the SQLite spool.
+#
+# A burst of hang-ups enqueues transcripts against the local fake N8N with a
+# failure rate, then the delivery workers are left to drain the spool. Reports
+# how long hang-up handling waited on the enqueue, how long delivery took and
+# whether every transcript reached N8N exactly once.
+#
+# Usage: python benchmarks/bench_delivery.py [--calls 200] [--failure-rate 0.3] [--batch-size 1]
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_n8n import FakeN8N  # noqa: E402
+
+import delivery  # noqa: E402
+from webhooks import WebhookClient  # noqa: E402
+
+
+async def main(args):
+    # Every retry logs a warning
+    logging.getLogger('delivery').setLevel(logging.ERROR)
+    n8n = await FakeN8N(args.latency, args.failure_rate).start()
+    client = WebhookClient(n8n.url)
+    # Short backoff so the benchmark drains in seconds
+    delivery.DELIVERY_BACKOFF = 0.05
+    delivery.DELIVERY_MAX_BACKOFF = 0.5
+    delivery.POLL_INTERVAL = 0.05
+    spool = tempfile.mktemp(suffix='.db')
+    queue = delivery.DeliveryQueue(spool, args.workers, args.batch_size, client)
+    await queue.start()
+
+    started = time.perf_counter()
+    enqueue_ms = []
+    for i in range(args.calls):
+        before = time.perf_counter()
+        await queue.enqueue({"route": "2", "number": "+15550100", "data": f"User: hello {i}\n"}, f"CA{i:06d}:transcript")
+        enqueue_ms.append((time.perf_counter() - before) * 1000)
+    # A replayed hang-up is stored once
+    await queue.enqueue({"route": "2", "number": "+15550100", "data": "User: hello 0\n"}, "CA000000:transcript")
+    while queue.pending and time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    client.close()
+    await n8n.stop()
+    os.remove(spool)
+
+    enqueue_ms.sort()
+    print(f"calls={args.calls} failureRate={args.failure_rate} workers={args.workers} batchSize={args.batch_size}")
+    print(f"enqueue p50={statistics.median(enqueue_ms):.2f} ms p99={enqueue_ms[int(len(enqueue_ms) * 0.99) - 1]:.2f} ms")
+    print(f"drained in {elapsed:.2f}s: delivered={len(n8n.transcripts)} requests={n8n.requests['2']} "
+          f"retries={queue.retries} duplicates={n8n.duplicates} pending={queue.pending} dead={queue.dead}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--workers', type=int, default=delivery.DELIVERY_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
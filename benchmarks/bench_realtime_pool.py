@@ -0,0 +1,73 @@
+# Benchmark: time-to-first-greeting with and without the Realtime pool.
+#
+# Simulated calls arrive at a fixed rate against the local fake Realtime
+# server. Each call takes a session from realtime_pool.RealtimePool, sends
+# the first message and waits for the first response.audio.delta.
+#
+# Usage: python benchmarks/bench_realtime_pool.py [--calls 30] [--rate 2]
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_realtime import FakeRealtimeServer  # noqa: E402
+
+from realtime_pool import RealtimePool  # noqa: E402
+
+
+def build_session_update():
+    return json.dumps({"type": "session.update", "session": {"voice": "shimmer"}})
+
+
+async def call(pool):
+    started = time.perf_counter()
+    ws, _ = await pool.acquire()
+    try:
+        await ws.send(json.dumps({"type": "conversation.item.create", "item": {"type": "message"}}))
+        await ws.send(json.dumps({"type": "response.create"}))
+        async for message in ws:
+            if json.loads(message).get('type') == 'response.audio.delta':
+                elapsed = time.perf_counter() - started
+                pool.record_first_greeting(elapsed)
+                return elapsed
+    finally:
+        await ws.close()
+
+
+async def run(server, calls, rate, max_size):
+    pool = RealtimePool(server.url, {}, build_session_update, min_size=1, max_size=max_size)
+    await pool.start()
+    await asyncio.sleep(2)  # Let the pool warm up
+    tasks = []
+    for _ in range(calls):
+        tasks.append(asyncio.create_task(call(pool)))
+        await asyncio.sleep(1 / rate)
+    samples = sorted(await asyncio.gather(*tasks))
+    await pool.stop()
+    return samples, pool.stats()
+
+
+async def main(args):
+    server = await FakeRealtimeServer(args.handshake_delay, args.session_delay, args.response_delay).start()
+    for label, max_size in (("no pool", 0), ("pool", args.max_size)):
+        samples, stats = await run(server, args.calls, args.rate, max_size)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{label:<8} p50={statistics.median(samples) * 1000:7.1f} ms  p95={p95 * 1000:7.1f} ms  "
+              f"hits={stats['hits']} misses={stats['misses']}")
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=2, help="call arrivals per second")
+    parser.add_argument('--max-size', type=int, default=8)
+    parser.add_argument('--handshake-delay', type=float, default=0.3)
+    parser.add_argument('--session-delay', type=float, default=0.2)
+    parser.add_argument('--response-delay', type=float, default=0.3)
+    asyncio.run(main(parser.parse_args()))
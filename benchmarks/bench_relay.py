@@ -0,0 +1,65 @@
+# Benchmark: relay queues against a lagging peer.
+#
+# Feeds 20 ms caller frames into the inbound relay queue in real time while
+# the peer socket is simulated with a per-message send cost and periodic
+# stalls. Compares each policy by messages sent, frames dropped and the
+# deepest the queue got, which is what bounds per-call memory.
+#
+# Usage: python benchmarks/bench_relay.py [--seconds 5] [--send-ms 2] [--stall-ms 300]
+import argparse
+import asyncio
+import base64
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import relay  # noqa: E402
+
+
+async def run(policy, coalesce, args):
+    frames = [base64.b64encode(random.randbytes(160)).decode() for _ in range(50)]
+    sent_bytes = 0
+    messages = 0
+
+    async def send(payload, _tag):
+        nonlocal sent_bytes, messages
+        messages += 1
+        sent_bytes += len(payload)
+        # Stall once a second, as a congested socket would
+        if messages % 50 == 0:
+            await asyncio.sleep(args.stall_ms / 1000)
+        await asyncio.sleep(args.send_ms / 1000)
+
+    queue = relay.AudioQueue('inbound', send, args.max_frames, policy, coalesce)
+    sender = asyncio.create_task(queue.run())
+    started = time.monotonic()
+    blocked = 0.0
+    for i in range(int(args.seconds / 0.02)):
+        before = time.monotonic()
+        await queue.put(frames[i % len(frames)])
+        blocked += time.monotonic() - before
+        await asyncio.sleep(max(0.0, started + (i + 1) * 0.02 - time.monotonic()))
+    while queue.stats()['depth'] and not queue.closed:
+        await asyncio.sleep(0.01)
+    sender.cancel()
+    stats = queue.stats()
+    print(f"{policy:<12} coalesce={coalesce:<3} frames={stats['queued']:5d} messages={messages:5d} "
+          f"dropped={stats['dropped']:4d} maxDepth={stats['maxDepth']:3d} reader blocked={blocked * 1000:7.1f} ms")
+
+
+async def main(args):
+    for policy in relay.POLICIES:
+        for coalesce in (1, 10):
+            await run(policy, coalesce, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--send-ms', type=float, default=2)
+    parser.add_argument('--stall-ms', type=float, default=300)
+    parser.add_argument('--max-frames', type=int, default=relay.RELAY_INBOUND_MAX_FRAMES)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+# Local stand-in for the N8N webhook.
+#
+# Answers the routes the app uses: "1" returns a personalized firstMessage,
+# "2" accepts a transcript and "3" confirms a meeting. Latency and a failure
+# rate can be set to exercise timeouts and retries. Batched deliveries
+# ({"route": ..., "batch": [...]}) are unpacked, and payloads whose
+# idempotencyKey was already seen are counted as duplicates, not stored.
+#
+# Run standalone: python benchmarks/fake_n8n.py --port 9002
+# then start the app with N8N_WEBHOOK_URL=http://127.0.0.1:9002/webhook
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+
+
+class FakeN8N:
+    def __init__(self, latency=0.3, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = Counter()
+        self.transcripts = []
+        self.idempotency_keys = set()
+        self.duplicates = 0
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{self.port}/webhook"
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def respond(self, payload):
+        route = payload.get('route')
+        self.requests[route] += 1
+        for item in payload.get('batch', [payload]):
+            key = item.get('idempotencyKey')
+            if key is not None:
+                if key in self.idempotency_keys:
+                    self.duplicates += 1
+                    continue
+                self.idempotency_keys.add(key)
+            if route == "2":
+                self.transcripts.append(item)
+        if route == "1":
+            return {"firstMessage": f"Hi, welcome back! You're calling from {payload.get('number')}. How can I help today?"}
+        if route == "2":
+            return {"ok": True}
+        if route == "3":
+            return {"message": "Your meeting is confirmed."}
+        return {"ok": True}
+
+    async def _handle(self, reader, writer):
+        try:
+            # Keep-alive: serve requests until the client closes the connection
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                await asyncio.sleep(self.latency)
+                if random.random() < self.failure_rate:
+                    status, response = "503 Service Unavailable", b'{"error": "unavailable"}'
+                else:
+                    status, response = "200 OK", json.dumps(self.respond(json.loads(body or b'{}'))).encode()
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(response)}\r\n\r\n".encode() + response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # CancelledError: keep-alive connections still open when the server stops
+            pass
+        finally:
+            writer.close()
+
+
+async def main(args):
+    server = await FakeN8N(args.latency, args.failure_rate).start(args.host, args.port)
+    print(f"Fake N8N webhook listening on {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9002)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,167 @@
+# Local stand-in for the OpenAI Realtime API WebSocket.
+#
+# Speaks enough of the protocol for the server under test: session.created
+# on connect, session.updated after session.update, and for every
+# response.create a short burst of g711 u-law response.audio.delta events
+# followed by response.done. Delays model the network and the model so pool
+# and latency benchmarks can run without an OpenAI account. With
+# interrupt_after set, the caller "barges in" that many seconds into each
+# reply: the server sends input_audio_buffer.speech_started, and any
+# conversation.item.truncate it receives is recorded in truncations. With
+# function_call=(name, arguments) the first reply on each connection ends in
+# that function call, and the function_call_output items sent back are
+# recorded in function_outputs.
+#
+# With vad=True the server mimics server_vad on the appended caller audio:
+# speech_started at the first non-silent frame, then after vad_silence_ms of
+# silence speech_stopped, the input transcription and an automatic reply.
+# With function_call_every=N, every Nth caller turn's reply ends in the
+# function call instead of the greeting.
+#
+# Run standalone: python benchmarks/fake_realtime.py --port 9001
+# then start the app with OPENAI_REALTIME_URL=ws://127.0.0.1:9001
+import argparse
+import asyncio
+import base64
+import contextlib
+import itertools
+import json
+
+import websockets
+
+# 20 ms of u-law silence at 8 kHz
+SILENCE_FRAME = base64.b64encode(b'\xff' * 160).decode()
+
+
+class FakeRealtimeServer:
+    def __init__(self, handshake_delay=0.3, session_delay=0.2, response_delay=0.3, audio_frames=25, interrupt_after=None,
+                 function_call=None, function_call_every=0, vad=False, vad_silence_ms=300):
+        self.handshake_delay = handshake_delay
+        self.session_delay = session_delay
+        self.response_delay = response_delay
+        self.audio_frames = audio_frames
+        self.interrupt_after = interrupt_after
+        self.truncations = []
+        self.function_call = function_call
+        self.function_call_every = function_call_every
+        self.function_outputs = []
+        self.vad = vad
+        self.vad_silence_ms = vad_silence_ms
+        self.connections = 0
+        self._ids = itertools.count(1)
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await websockets.serve(self._handle, host, port, process_request=self._process_request)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://{host}:{self.port}"
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _process_request(self, _path, _headers):
+        # Stands in for TLS + upgrade latency
+        await asyncio.sleep(self.handshake_delay)
+
+    def _event(self, event_type, **fields):
+        return json.dumps({"type": event_type, "event_id": f"event_{next(self._ids)}", **fields})
+
+    async def _handle(self, ws, _path=None):
+        self.connections += 1
+        await ws.send(self._event("session.created", session={}))
+        responding = None
+        calls = [self.function_call] if self.function_call and not self.function_call_every else []
+        speaking = False
+        silence_ms = 0
+        turns = 0
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                event_type = event.get('type')
+                if event_type == 'input_audio_buffer.append':
+                    if not self.vad:
+                        continue
+                    audio = base64.b64decode(event.get('audio', ''))
+                    if audio.strip(b'\xff\x7f'):
+                        silence_ms = 0
+                        if not speaking:
+                            speaking = True
+                            await ws.send(self._event("input_audio_buffer.speech_started", audio_start_ms=0,
+                                                      item_id=f"item_{next(self._ids)}"))
+                    elif speaking:
+                        silence_ms += len(audio) / 8
+                        if silence_ms >= self.vad_silence_ms:
+                            speaking = False
+                            turns += 1
+                            item_id = f"item_{next(self._ids)}"
+                            await ws.send(self._event("input_audio_buffer.speech_stopped", audio_end_ms=0, item_id=item_id))
+                            await ws.send(self._event("input_audio_buffer.committed", item_id=item_id))
+                            await ws.send(self._event("conversation.item.input_audio_transcription.completed",
+                                                      item_id=item_id, content_index=0, transcript=f"Caller turn {turns}"))
+                            function_call = None
+                            if self.function_call_every and turns % self.function_call_every == 0:
+                                function_call = self.function_call
+                            responding = asyncio.create_task(self._respond(ws, function_call))
+                elif event_type == 'session.update':
+                    await asyncio.sleep(self.session_delay)
+                    await ws.send(self._event("session.updated", session=event.get('session', {})))
+                elif event_type == 'conversation.item.create':
+                    if event.get('item', {}).get('type') == 'function_call_output':
+                        self.function_outputs.append(event['item'])
+                    await ws.send(self._event("conversation.item.created", item=event.get('item', {})))
+                elif event_type == 'response.create':
+                    responding = asyncio.create_task(self._respond(ws, calls.pop() if calls else None))
+                elif event_type == 'response.cancel' and responding:
+                    responding.cancel()
+                elif event_type == 'conversation.item.truncate':
+                    self.truncations.append(event)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if responding:
+                responding.cancel()
+
+    async def _respond(self, ws, function_call=None):
+        response_id = f"resp_{next(self._ids)}"
+        item_id = f"item_{next(self._ids)}"
+        await ws.send(self._event("response.created", response={"id": response_id}))
+        await asyncio.sleep(self.response_delay)
+        if self.interrupt_after is not None:
+            asyncio.get_running_loop().call_later(self.interrupt_after, asyncio.ensure_future, self._barge_in(ws))
+        for _ in range(self.audio_frames):
+            await ws.send(self._event("response.audio.delta", response_id=response_id, item_id=item_id,
+                                      output_index=0, content_index=0, delta=SILENCE_FRAME))
+        await ws.send(self._event("response.audio.done", response_id=response_id, item_id=item_id))
+        await ws.send(self._event("response.done", response={
+            "id": response_id,
+            "output": [{"id": item_id, "content": [{"type": "audio", "transcript": "Hello from the fake Realtime API."}]}]
+        }))
+        if function_call:
+            name, arguments = function_call
+            await ws.send(self._event("response.function_call_arguments.done", response_id=response_id,
+                                      item_id=f"item_{next(self._ids)}", output_index=1,
+                                      call_id=f"call_{next(self._ids)}", name=name, arguments=json.dumps(arguments)))
+
+    async def _barge_in(self, ws):
+        with contextlib.suppress(websockets.ConnectionClosed):
+            await ws.send(self._event("input_audio_buffer.speech_started", audio_start_ms=0, item_id=f"item_{next(self._ids)}"))
+
+
+async def main(args):
+    server = await FakeRealtimeServer(args.handshake_delay, args.session_delay, args.response_delay,
+                                      vad=args.vad).start(args.host, args.port)
+    print(f"Fake Realtime API listening on {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9001)
+    parser.add_argument('--handshake-delay', type=float, default=0.3)
+    parser.add_argument('--session-delay', type=float, default=0.2)
+    parser.add_argument('--response-delay', type=float, default=0.3)
+    parser.add_argument('--vad', action='store_true', help="detect caller speech in the appended audio")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+# Local stand-in for a Redis server, for load tests of SESSION_BACKEND=redis://
+#
+# Implements the commands session_backends.RedisBackend uses: PING, AUTH,
+# SELECT, GET, SET (with EX, XX and KEEPTTL), DEL and SCAN (with MATCH/COUNT).
+#
+# Run standalone: python benchmarks/fake_redis.py --port 6390
+import argparse
+import asyncio
+import fnmatch
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.url = f"redis://{host}:{self.port}/0"
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, command, args):
+        if command in ('PING', 'AUTH', 'SELECT'):
+            return 'PONG' if command == 'PING' else 'OK'
+        if command == 'GET':
+            entry = self._live(args[0])
+            return entry[0] if entry else None
+        if command == 'SET':
+            options = [arg.upper() for arg in args[2:]]
+            entry = self._live(args[0])
+            if 'XX' in options and entry is None:
+                return None
+            expires_at = None
+            if 'EX' in options:
+                expires_at = time.time() + int(args[2 + options.index('EX') + 1])
+            elif 'KEEPTTL' in options and entry is not None:
+                expires_at = entry[1]
+            self.data[args[0]] = (args[1], expires_at)
+            return 'OK'
+        if command == 'DEL':
+            return sum(1 for key in args if self.data.pop(key, None) is not None)
+        if command == 'SCAN':
+            pattern = args[args.index('MATCH') + 1] if 'MATCH' in args else '*'
+            keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key, pattern)]
+            return ['0', keys]
+        raise ValueError(f"ERR unknown command '{command}'")
+
+    def _encode(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+        if value == 'OK' or value == 'PONG':
+            return f"+{value}\r\n".encode()
+        data = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                try:
+                    writer.write(self._encode(self.execute(args[0].upper(), args[1:])))
+                except ValueError as e:
+                    writer.write(f"-{e}\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main(args):
+    server = await FakeRedis().start(args.host, args.port)
+    print(f"Fake Redis listening on {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,214 @@
+# Load test: N simulated Twilio calls against several app workers.
+#
+# By default this spawns --workers separate app processes (each on its own
+# port, standing in for uvicorn workers or nodes) together with the local fake
+# Realtime API, fake N8N and, for --backend redis, a fake Redis. Every call
+# posts /incoming-call to one worker and opens /media-stream on the next one,
+# so the session has to travel through the shared backend. With --affinity
+# the media stream follows the Stream URL from the TwiML instead.
+#
+# Usage:
+#   python benchmarks/load_test.py --workers 3 --backend sqlite --calls 60 --concurrency 20
+#   python benchmarks/load_test.py --target http://10.0.0.5:8000 --target http://10.0.0.6:8000
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import requests
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_n8n import FakeN8N  # noqa: E402
+from fake_realtime import FakeRealtimeServer  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+
+# 20 ms of caller audio (u-law silence)
+CALLER_FRAME = base64.b64encode(b'\xff' * 160).decode()
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else float('nan')
+
+
+async def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await asyncio.to_thread(requests.get, url, timeout=1)).ok:
+                return
+        except requests.RequestException:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def spawn_workers(args, fakes):
+    # Spools go to a scratch directory, not the repository; the workers share
+    # it as processes on one machine would
+    spool_dir = tempfile.mkdtemp(prefix='load-test-')
+    env = dict(os.environ,
+               OPENAI_API_KEY='test',
+               OPENAI_REALTIME_URL=fakes['realtime'].url,
+               N8N_WEBHOOK_URL=fakes['n8n'].url,
+               SESSION_BACKEND=fakes['backend'],
+               DELIVERY_SPOOL_PATH=os.path.join(spool_dir, 'webhook_spool.db'),
+               TRANSCRIPT_SPOOL_DIR=os.path.join(spool_dir, 'transcripts'))
+    processes, targets = [], []
+    for i in range(args.workers):
+        port = args.base_port + i
+        url = f"http://127.0.0.1:{port}"
+        worker_env = dict(env, NODE_ID=f"worker-{i}", NODE_PUBLIC_URL=url, REPL_PUBLIC_URL=url)
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+            cwd=ROOT, env=worker_env, stdout=subprocess.DEVNULL if args.quiet else None
+        ))
+        targets.append(url)
+    await asyncio.gather(*(wait_until_up(url + '/') for url in targets))
+    return processes, targets
+
+
+async def simulated_call(i, targets, args, results):
+    call_sid = f"CA{uuid.uuid4().hex}"
+    stream_sid = f"MZ{uuid.uuid4().hex}"
+    caller_number = f"+1555{i:07d}"
+    answer_target = targets[i % len(targets)]
+    started = time.monotonic()
+
+    response = await asyncio.to_thread(
+        requests.post, answer_target + '/incoming-call', data={'CallSid': call_sid, 'From': caller_number}, timeout=10
+    )
+    response.raise_for_status()
+    twiml_at = time.monotonic()
+
+    if args.affinity:
+        stream_url = re.search(r'<Stream url="([^"]+)"', response.text).group(1)
+        stream_url = stream_url.replace('https://', 'wss://').replace('http://', 'ws://')
+    else:
+        stream_target = targets[(i + 1) % len(targets)]
+        stream_url = stream_target.replace('http://', 'ws://').replace('https://', 'wss://') + '/media-stream'
+
+    first_audio_at = None
+    frames_received = 0
+    async with websockets.connect(stream_url) as ws:
+        await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        start_sent_at = time.monotonic()
+        await ws.send(json.dumps({"event": "start", "sequenceNumber": "1", "streamSid": stream_sid, "start": {
+            "streamSid": stream_sid, "callSid": call_sid, "tracks": ["inbound"],
+            "customParameters": {"callerNumber": caller_number},
+            "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}
+        }}))
+
+        async def receive():
+            nonlocal first_audio_at, frames_received
+            async for message in ws:
+                if json.loads(message).get('event') == 'media':
+                    frames_received += 1
+                    if first_audio_at is None:
+                        first_audio_at = time.monotonic()
+
+        receiver = asyncio.create_task(receive())
+        for sequence in range(int(args.call_seconds / 0.02)):
+            await ws.send('{"event":"media","sequenceNumber":"%d","media":{"track":"inbound","chunk":"%d",'
+                          '"timestamp":"%d","payload":"%s"},"streamSid":"%s"}'
+                          % (sequence + 2, sequence + 1, sequence * 20, CALLER_FRAME, stream_sid))
+            await asyncio.sleep(0.02)
+        await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+        receiver.cancel()
+
+    results.append({
+        "twiml": twiml_at - started,
+        "firstAudio": first_audio_at - start_sent_at if first_audio_at else None,
+        "frames": frames_received
+    })
+
+
+async def run_calls(targets, args):
+    results, errors = [], []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            try:
+                await simulated_call(i, targets, args, results)
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.monotonic()
+    await asyncio.gather(*(bounded(i) for i in range(args.calls)))
+    return results, errors, time.monotonic() - started
+
+
+def report(results, errors, elapsed, targets):
+    twiml = [r['twiml'] for r in results]
+    first_audio = [r['firstAudio'] for r in results if r['firstAudio'] is not None]
+    print(f"calls ok={len(results)} failed={len(errors)} no-audio={len(results) - len(first_audio)} in {elapsed:.1f}s")
+    for label, samples in (("TwiML", twiml), ("first audio after start", first_audio)):
+        if samples:
+            print(f"  {label:<24} p50={percentile(samples, 0.5) * 1000:7.1f} ms  "
+                  f"p95={percentile(samples, 0.95) * 1000:7.1f} ms  p99={percentile(samples, 0.99) * 1000:7.1f} ms")
+    for error in sorted(set(errors))[:5]:
+        print("  error:", error)
+    for url in targets:
+        try:
+            sessions = requests.get(url + '/sessions', timeout=5).json()
+            first_message = requests.get(url + '/first-message', timeout=5).json()
+            print(f"  {sessions['node']}: local={sessions['localAttaches']} remote={sessions['remoteAttaches']} "
+                  f"unknown={sessions['unknownAttaches']} greetings from backend={first_message['fromBackend']}")
+        except Exception as e:
+            print(f"  {url}: stats unavailable ({e})")
+
+
+async def main(args):
+    processes, fakes = [], {}
+    try:
+        if args.target:
+            targets = args.target
+        else:
+            fakes['realtime'] = await FakeRealtimeServer(0.1, 0.05, args.model_latency).start()
+            fakes['n8n'] = await FakeN8N(args.n8n_latency).start()
+            if args.backend == 'redis':
+                fakes['redis'] = await FakeRedis().start()
+                fakes['backend'] = fakes['redis'].url
+            elif args.backend == 'sqlite':
+                fakes['backend'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'sessions.db')
+            else:
+                fakes['backend'] = 'memory'
+            processes, targets = await spawn_workers(args, fakes)
+        results, errors, elapsed = await run_calls(targets, args)
+        await asyncio.to_thread(report, results, errors, elapsed, targets)
+    finally:
+        for process in processes:
+            process.terminate()
+        # The fakes keep serving while workers finish hang-up webhooks
+        for process in processes:
+            await asyncio.to_thread(process.wait)
+        for fake in fakes.values():
+            if hasattr(fake, 'stop'):
+                await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', action='append', help="URL of an already running worker (repeatable)")
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--base-port', type=int, default=8101)
+    parser.add_argument('--backend', choices=('memory', 'sqlite', 'redis'), default='sqlite')
+    parser.add_argument('--calls', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--call-seconds', type=float, default=3)
+    parser.add_argument('--n8n-latency', type=float, default=0.3)
+    parser.add_argument('--model-latency', type=float, default=0.3)
+    parser.add_argument('--affinity', action='store_true', help="open the media stream on the node named in the TwiML")
+    parser.add_argument('--quiet', action='store_true', help="hide worker output")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,342 @@
+# Offline call replay: end-to-end latency benchmark for /media-stream.
+#
+# Runs the FastAPI app in a worker process against local stand-ins: the fake
+# Realtime API (with VAD, scripted function calls and streamed audio), the
+# fake N8N webhook and a fake Pinecone Assistant installed with
+# rag.set_assistant. A fake Twilio client then places calls: it posts
+# /incoming-call, opens the media stream, sends start/media/stop events at
+# real time (or --speed times faster) and plays agent audio back, echoing
+# marks once each chunk would have finished playing.
+#
+# Each call follows a script: silence while the greeting plays, then --turns
+# caller turns of speech and silence. With --recording the caller side is
+# replayed from captured Twilio messages instead (one JSON message per line;
+# CallSid and streamSid are rewritten for each simulated call).
+#
+# Calls run at each concurrency level in --levels; for every level the report
+# gives p50/p95/p99 time to first audio (start event to first agent audio)
+# and turn latency (end of caller speech to first agent audio), the app's CPU
+# seconds per call (from process_cpu_seconds_total on /metrics), and failures.
+# The highest level whose p95 turn latency stays under --slo-ms without
+# failures is the max sustainable concurrency for one process.
+#
+# Usage:
+#   python benchmarks/replay.py --levels 5,10,20,40 --turns 3 --speed 1
+#   python benchmarks/replay.py --recording call.jsonl --levels 10
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import requests
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_n8n import FakeN8N  # noqa: E402
+from fake_realtime import FakeRealtimeServer  # noqa: E402
+
+FRAME_MS = 20
+SILENCE = base64.b64encode(b'\xff' * 160).decode()
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else float('nan')
+
+
+def speech_frame():
+    # Mid-level u-law noise; anything but silence counts as speech for the fake VAD
+    return base64.b64encode(bytes(random.randint(0x20, 0x60) for _ in range(160))).decode()
+
+
+def is_speech(payload):
+    return bool(base64.b64decode(payload).strip(b'\xff\x7f'))
+
+
+# Caller side of a call: (offset ms, Twilio message) pairs, with CALL_SID and
+# STREAM_SID placeholders filled in per call
+def scripted_call(turns, greeting_s, speech_s, listen_s):
+    events = [(0, {"event": "connected", "protocol": "Call", "version": "1.0.0"}),
+              (0, {"event": "start", "start": {"streamSid": "STREAM_SID", "callSid": "CALL_SID",
+                                               "customParameters": {"callerNumber": "CALLER_NUMBER"},
+                                               "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}}})]
+    speech = [speech_frame() for _ in range(10)]
+    offset = 0
+    segments = [(greeting_s, False)]
+    for _ in range(turns):
+        segments += [(speech_s, True), (listen_s, False)]
+    for seconds, speaking in segments:
+        for i in range(int(seconds * 1000 / FRAME_MS)):
+            payload = speech[i % len(speech)] if speaking else SILENCE
+            events.append((offset, {"event": "media", "media": {"track": "inbound", "timestamp": str(offset), "payload": payload}}))
+            offset += FRAME_MS
+    events.append((offset, {"event": "stop"}))
+    return events
+
+
+def recorded_call(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            offset = int(message.get('media', {}).get('timestamp', events[-1][0] if events else 0))
+            if message.get('event') == 'start':
+                message['start'].update(streamSid="STREAM_SID", callSid="CALL_SID")
+                message['start'].setdefault('customParameters', {})['callerNumber'] = "CALLER_NUMBER"
+            events.append((offset, message))
+    return events
+
+
+def fill(message, call_sid, stream_sid, caller_number):
+    text = json.dumps(message).replace("CALL_SID", call_sid).replace("STREAM_SID", stream_sid)
+    message = json.loads(text.replace("CALLER_NUMBER", caller_number))
+    if message.get('event') != 'connected':
+        message['streamSid'] = stream_sid
+    return message
+
+
+async def twilio_call(target, script, speed):
+    call_sid = f"CA{uuid.uuid4().hex}"
+    stream_sid = f"MZ{uuid.uuid4().hex}"
+    caller_number = f"+1555{random.randint(0, 9999999):07d}"
+    response = await asyncio.to_thread(requests.post, target + '/incoming-call',
+                                       data={'CallSid': call_sid, 'From': caller_number}, timeout=10)
+    response.raise_for_status()
+
+    loop = asyncio.get_running_loop()
+    received = []
+    speech_ends = []
+    started_at = None
+    async with websockets.connect(target.replace('http', 'ws') + '/media-stream') as ws:
+        playing_until = 0.0
+
+        async def echo(message):
+            with contextlib.suppress(websockets.ConnectionClosed):
+                await ws.send(message)
+
+        pending_marks = []
+
+        def played(entry):
+            pending_marks.remove(entry)
+            asyncio.ensure_future(echo(entry[1]))
+
+        async def receive():
+            nonlocal playing_until
+            async for message in ws:
+                event = json.loads(message)
+                now = loop.time()
+                if event.get('event') == 'media':
+                    received.append(time.monotonic())
+                    ms = len(base64.b64decode(event['media']['payload'])) / 8
+                    playing_until = max(playing_until, now) + ms / 1000 / speed
+                elif event.get('event') == 'mark':
+                    # Twilio echoes the mark once the audio before it has played
+                    entry = [None, message]
+                    entry[0] = loop.call_at(playing_until, played, entry)
+                    pending_marks.append(entry)
+                elif event.get('event') == 'clear':
+                    # and echoes every pending mark straight away on clear
+                    playing_until = now
+                    for handle, mark in pending_marks:
+                        handle.cancel()
+                        asyncio.ensure_future(echo(mark))
+                    pending_marks.clear()
+
+        receiver = asyncio.create_task(receive())
+        replay_started = time.monotonic()
+        was_speaking = False
+        try:
+            for offset, message in script:
+                delay = replay_started + offset / 1000 / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                message = fill(message, call_sid, stream_sid, caller_number)
+                if message['event'] == 'start':
+                    started_at = time.monotonic()
+                elif message['event'] == 'media':
+                    speaking = is_speech(message['media']['payload'])
+                    if was_speaking and not speaking:
+                        speech_ends.append(time.monotonic())
+                    was_speaking = speaking
+                await ws.send(json.dumps(message))
+        finally:
+            receiver.cancel()
+
+    first_audio = next((t - started_at for t in received if t >= started_at), None) if started_at else None
+    turns = []
+    for end in speech_ends:
+        reply = next((t for t in received if t > end), None)
+        if reply is not None:
+            turns.append(reply - end)
+    return {"firstAudio": first_audio, "turns": turns}
+
+
+def app_cpu_seconds(target):
+    for line in requests.get(target + '/metrics', timeout=5).text.splitlines():
+        if line.startswith('process_cpu_seconds_total '):
+            return float(line.split()[1])
+    return float('nan')
+
+
+async def run_level(target, script, concurrency, args):
+    cpu_before = await asyncio.to_thread(app_cpu_seconds, target)
+    results, errors = [], []
+
+    async def one():
+        try:
+            results.append(await twilio_call(target, script, args.speed))
+        except Exception as e:
+            errors.append(repr(e))
+
+    started = time.monotonic()
+    # Stagger arrivals over one second, as real calls would not all start at once
+    calls = []
+    for _ in range(concurrency):
+        calls.append(asyncio.create_task(one()))
+        await asyncio.sleep(1 / concurrency)
+    await asyncio.gather(*calls)
+    elapsed = time.monotonic() - started
+    # Let the app finish hang-up work before reading its CPU time
+    await asyncio.sleep(1)
+    cpu = await asyncio.to_thread(app_cpu_seconds, target) - cpu_before
+    return {
+        "concurrency": concurrency,
+        "ok": len(results),
+        "failed": len(errors),
+        "noAudio": sum(1 for r in results if r['firstAudio'] is None),
+        "firstAudio": [r['firstAudio'] for r in results if r['firstAudio'] is not None],
+        "turns": [latency for r in results for latency in r['turns']],
+        "cpuPerCall": cpu / max(1, len(results)),
+        "elapsed": elapsed,
+        "errors": sorted(set(errors))[:3]
+    }
+
+
+def format_samples(samples):
+    if not samples:
+        return "       n/a"
+    return "  ".join(f"{label}={percentile(samples, fraction) * 1000:6.0f}"
+                     for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)))
+
+
+def report(levels, args):
+    print(f"{'calls':>5} {'ok':>4} {'fail':>4}  time to first audio (ms)          turn latency (ms)                 CPU/call")
+    sustainable = None
+    for level in levels:
+        print(f"{level['concurrency']:5d} {level['ok']:4d} {level['failed'] + level['noAudio']:4d}  "
+              f"{format_samples(level['firstAudio'])}  {format_samples(level['turns'])}  {level['cpuPerCall'] * 1000:6.1f} ms")
+        for error in level['errors']:
+            print("      error:", error)
+        turn_p95 = percentile(level['turns'], 0.95) * 1000
+        if level['failed'] == 0 and level['noAudio'] == 0 and turn_p95 <= args.slo_ms:
+            sustainable = level['concurrency']
+    if sustainable is None:
+        print(f"No level kept p95 turn latency under {args.slo_ms:.0f} ms")
+    else:
+        print(f"Max sustainable concurrency per process: {sustainable} calls (p95 turn latency <= {args.slo_ms:.0f} ms)")
+
+
+class FakeAssistant:
+    # Pinecone Assistant stand-in: streams a canned answer after a delay
+    ANSWER = "Our AI employees answer calls, book meetings and follow up with leads."
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def chat(self, messages, stream=True):  # noqa: ARG002 - rag.py passes both by keyword
+        from types import SimpleNamespace
+        time.sleep(self.latency)
+        for word in self.ANSWER.split(' '):
+            yield SimpleNamespace(type="content_chunk", delta=SimpleNamespace(content=word + ' '))
+
+
+def serve_app(args):
+    # Worker process: the app with the Pinecone stand-in installed
+    import uvicorn
+
+    import main
+    import rag
+    rag.set_assistant(FakeAssistant(args.rag_latency))
+    uvicorn.run(main.app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+async def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await asyncio.to_thread(requests.get, url, timeout=1)).ok:
+                return
+        except requests.RequestException:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def main(args):
+    if args.recording:
+        script = recorded_call(args.recording)
+    else:
+        script = scripted_call(args.turns, args.greeting_seconds, args.speech_seconds, args.listen_seconds)
+
+    realtime = await FakeRealtimeServer(args.handshake_delay, 0.05, args.model_latency, args.audio_frames,
+                                        function_call=("question_and_answer", {"question": "What do your AI employees do?"}),
+                                        function_call_every=args.tool_every, vad=True).start()
+    n8n = await FakeN8N(args.n8n_latency).start()
+    target = f"http://127.0.0.1:{args.port}"
+    # Spools go to a scratch directory, not the repository
+    spool_dir = tempfile.mkdtemp(prefix='replay-')
+    env = dict(os.environ, OPENAI_API_KEY='test', OPENAI_REALTIME_URL=realtime.url, N8N_WEBHOOK_URL=n8n.url,
+               REPL_PUBLIC_URL=target, LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'),
+               DELIVERY_SPOOL_PATH=os.path.join(spool_dir, 'webhook_spool.db'),
+               TRANSCRIPT_SPOOL_DIR=os.path.join(spool_dir, 'transcripts'))
+    worker = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-app', '--port', str(args.port),
+                               '--rag-latency', str(args.rag_latency)], cwd=ROOT, env=env)
+    try:
+        await wait_until_up(target + '/')
+        levels = []
+        for concurrency in (int(level) for level in args.levels.split(',')):
+            levels.append(await run_level(target, script, concurrency, args))
+        await asyncio.to_thread(report, levels, args)
+    finally:
+        worker.terminate()
+        # The fakes keep serving while the worker finishes hang-up webhooks
+        await asyncio.to_thread(worker.wait)
+        await realtime.stop()
+        await n8n.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', default='5,10,20', help="comma-separated numbers of concurrent calls")
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--greeting-seconds', type=float, default=2.0)
+    parser.add_argument('--speech-seconds', type=float, default=1.5)
+    parser.add_argument('--listen-seconds', type=float, default=3.0)
+    parser.add_argument('--recording', help="Twilio messages to replay, one JSON message per line")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed relative to real time")
+    parser.add_argument('--tool-every', type=int, default=2, help="every Nth caller turn calls question_and_answer (0: never)")
+    parser.add_argument('--slo-ms', type=float, default=800, help="p95 turn latency a sustainable level must meet")
+    parser.add_argument('--handshake-delay', type=float, default=0.1)
+    parser.add_argument('--model-latency', type=float, default=0.3)
+    parser.add_argument('--audio-frames', type=int, default=25)
+    parser.add_argument('--n8n-latency', type=float, default=0.3)
+    parser.add_argument('--rag-latency', type=float, default=0.8)
+    parser.add_argument('--port', type=int, default=8120)
+    parser.add_argument('--serve-app', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_app:
+        serve_app(args)
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,183 @@
+# Cache of caller context from N8N route "1", keyed by the caller's number.
+#
+# Route "1" builds the personalized first message from the caller's history.
+# A repeat caller within CALLER_CACHE_TTL gets the cached context with no
+# webhook request. Past the TTL and up to CALLER_CACHE_STALE_TTL, the cached
+# context is still served at once while a background refresh fetches a new one
+# (stale-while-revalidate); older entries are refetched before use. Entries are
+# bounded by CALLER_CACHE_MAX_ENTRIES, least recently used first out.
+#
+# Once a caller's call transcript has been delivered on route "2", their entry
+# is marked stale and refetched in the background, so the next greeting
+# reflects the latest call without the caller waiting on the webhook. The
+# cache is per process; other workers pick up the change when their entry
+# goes stale.
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from webhooks import webhook_client
+
+logger = logging.getLogger(__name__)
+
+CALLER_CACHE_TTL = float(os.getenv('CALLER_CACHE_TTL', 300))
+CALLER_CACHE_STALE_TTL = float(os.getenv('CALLER_CACHE_STALE_TTL', 86400))
+CALLER_CACHE_MAX_ENTRIES = int(os.getenv('CALLER_CACHE_MAX_ENTRIES', 10000))
+
+
+def normalize_number(number):
+    # Withheld numbers ("Anonymous", "Unknown") are shared by many callers and never cached
+    number = (number or '').strip().replace(' ', '')
+    return number if number.lstrip('+').isdigit() else None
+
+
+async def fetch_caller_context(caller_number):
+    # The route "1" response as a dict with at least "firstMessage", or None
+    try:
+        webhook_response = await webhook_client.post({
+            "route": "1",
+            "number": caller_number,
+            "data": "empty"
+        })
+    except Exception as e:
+        logger.error('Error sending data to N8N webhook: %s', e)
+        return None
+    if not webhook_response.ok:
+        logger.warning('Failed to send data to N8N webhook: %s', webhook_response.status_code)
+        return None
+    response_text = webhook_response.text
+    try:
+        response_data = json.loads(response_text)
+    except json.JSONDecodeError:
+        response_data = {"firstMessage": response_text.strip()}
+    if not isinstance(response_data, dict) or not response_data.get('firstMessage'):
+        return None
+    logger.info('Parsed firstMessage from N8N: %s', response_data['firstMessage'])
+    return response_data
+
+
+class _Entry:
+    __slots__ = ('context', 'fetched_at')
+
+    def __init__(self, context, fetched_at):
+        self.context = context
+        self.fetched_at = fetched_at
+
+
+class CallerCache:
+    def __init__(self, fetch=fetch_caller_context, ttl=CALLER_CACHE_TTL, stale_ttl=CALLER_CACHE_STALE_TTL,
+                 max_entries=CALLER_CACHE_MAX_ENTRIES):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # One fetch per number at a time; invalidate() detaches it so its result is not stored
+        self._inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, caller_number):
+        # Cached context, or None; a stale hit starts a background refresh
+        key = normalize_number(caller_number)
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            self.misses += 1
+            return None
+        age = time.monotonic() - entry.fetched_at
+        if age >= self.stale_ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if age < self.ttl:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            if key not in self._inflight:
+                self.refreshes += 1
+                self._start_fetch(key, caller_number)
+        return entry.context
+
+    async def load(self, caller_number):
+        # Fetch from N8N, sharing a fetch already in flight for the number
+        key = normalize_number(caller_number)
+        if key is None:
+            return await self.fetch(caller_number)
+        task = self._inflight.get(key) or self._start_fetch(key, caller_number)
+        return await asyncio.shield(task)
+
+    def put(self, caller_number, context):
+        key = normalize_number(caller_number)
+        if key is None:
+            return
+        self._entries[key] = _Entry(context, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def revalidate(self, caller_number):
+        # Refetch in the background, serving the cached context until the new
+        # one arrives; the entry stays stale if the refetch fails
+        key = normalize_number(caller_number)
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            return False
+        entry.fetched_at = min(entry.fetched_at, time.monotonic() - self.ttl)
+        # A fetch already in flight may have started before the new transcript
+        self._inflight.pop(key, None)
+        self.refreshes += 1
+        self._start_fetch(key, caller_number)
+        return True
+
+    def invalidate(self, caller_number=None):
+        if caller_number is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._inflight.clear()
+            return removed
+        key = normalize_number(caller_number)
+        self._inflight.pop(key, None)
+        return 1 if self._entries.pop(key, None) else 0
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl,
+            "staleTtlSeconds": self.stale_ttl,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "inFlight": len(self._inflight),
+            "evictions": self.evictions,
+            "hitRate": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+    def _start_fetch(self, key, caller_number):
+        task = asyncio.create_task(self.fetch(caller_number))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._fetched(key, done))
+        return task
+
+    def _fetched(self, key, task):
+        if self._inflight.get(key) is not task:
+            # Invalidated while the fetch was running
+            return
+        del self._inflight[key]
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self.put(key, task.result())
+        elif not task.cancelled() and task.exception() is not None:
+            logger.error('Error fetching caller context: %s', task.exception())
+
+
+caller_cache = CallerCache()
@@ -0,0 +1,91 @@
+# JSON codec for the audio relay hot loop.
+#
+# Uses orjson or msgspec when installed and falls back to the standard
+# library. Audio frames skip JSON parsing entirely: the event type is read
+# from the start of the message and the base64 audio is sliced out and
+# spliced into pre-built message templates. This relies on Twilio sending
+# "event" and OpenAI sending "type" as the first key, and on base64 audio,
+# sids and item ids never containing escaped characters. Anything else
+# falls back to a full parse.
+#
+# Slicing the payload out of a Twilio media frame scans most of the message,
+# and measured against orjson or msgspec parsing the whole frame it is not
+# reliably faster, so it is only used with the standard library parser
+# (see benchmarks/bench_codec.py).
+import json
+
+try:
+    import orjson
+
+    JSON_BACKEND = 'orjson'
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    try:
+        import msgspec
+
+        JSON_BACKEND = 'msgspec'
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+
+        def loads(data):
+            return _decoder.decode(data)
+
+        def dumps(obj):
+            return _encoder.encode(obj).decode()
+    except ImportError:
+        JSON_BACKEND = 'json'
+
+        def loads(data):
+            return json.loads(data)
+
+        def dumps(obj):
+            return json.dumps(obj, separators=(',', ':'))
+
+
+# Whether to slice the payload out of Twilio media frames instead of parsing them
+PEEK_TWILIO_MEDIA = JSON_BACKEND == 'json'
+
+_TWILIO_EVENT = '{"event":"'
+_OPENAI_TYPE = '{"type":"'
+
+
+def _peek(message, prefix):
+    if message.startswith(prefix):
+        end = message.find('"', len(prefix))
+        if end != -1:
+            return message[len(prefix):end]
+    return None
+
+
+# Event type of a Twilio media stream message, or None if it must be parsed
+def peek_twilio_event(message):
+    return _peek(message, _TWILIO_EVENT)
+
+
+# Event type of an OpenAI Realtime message, or None if it must be parsed
+def peek_openai_type(message):
+    return _peek(message, _OPENAI_TYPE)
+
+
+# Value of a string field that cannot contain escapes (base64 audio, ids)
+def extract_string(message, key):
+    marker = '"' + key + '":"'
+    start = message.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = message.find('"', start)
+    return message[start:end] if end != -1 else None
+
+
+def openai_audio_append(payload):
+    return '{"type":"input_audio_buffer.append","audio":"' + payload + '"}'
+
+
+def twilio_media(stream_sid, payload):
+    return '{"event":"media","streamSid":"' + stream_sid + '","media":{"payload":"' + payload + '"}}'
@@ -0,0 +1,252 @@
+# Background delivery of fire-and-forget webhook payloads.
+#
+# Transcript uploads (route "2") used to be a POST made at hang-up, lost when
+# N8N was slow or down. They are now written to a local SQLite spool and sent
+# by a small pool of workers, so the hang-up path only waits for one local
+# insert. Failed sends are retried with exponential backoff and jitter; after
+# DELIVERY_MAX_ATTEMPTS the row is kept in the spool, marked dead, for manual
+# replay. Pending rows survive a restart and are sent when the app comes back.
+#
+# Every payload carries an idempotency key (from the CallSid), sent as the
+# Idempotency-Key header and as "idempotencyKey" in the payload, so N8N can
+# drop the duplicates a retry after a lost response produces. Enqueueing the
+# same key twice stores it once.
+#
+# Callbacks registered with on_delivered(route, callback) run with each
+# payload once N8N has accepted it.
+#
+# With DELIVERY_BATCH_SIZE > 1, due payloads for the same route are sent
+# together as {"route": ..., "batch": [payload, ...]}; the N8N workflow must
+# accept that shape, so batching is off by default.
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+
+import codec
+from metrics import Counter
+from sqlite_db import SQLiteDatabase
+from webhooks import webhook_client
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_SPOOL_PATH = os.getenv('DELIVERY_SPOOL_PATH', 'webhook_spool.db')
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 4))
+DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', 1))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 12))
+# Seconds before the first retry; doubled on each attempt up to the maximum
+DELIVERY_BACKOFF = float(os.getenv('DELIVERY_BACKOFF', 2.0))
+DELIVERY_MAX_BACKOFF = float(os.getenv('DELIVERY_MAX_BACKOFF', 600))
+# How long workers may finish in-flight sends at shutdown
+DELIVERY_DRAIN_TIMEOUT = float(os.getenv('DELIVERY_DRAIN_TIMEOUT', 10))
+# A claimed row not sent or rescheduled within this many seconds (the process
+# died mid-send) becomes due again
+DELIVERY_LEASE = 120
+# Idle workers re-check the spool this often for retries that fell due
+POLL_INTERVAL = 1.0
+
+DELIVERY_SENT = Counter('webhook_deliveries_sent_total', 'Spooled webhook payloads delivered', ['route'])
+DELIVERY_RETRIES = Counter('webhook_delivery_retries_total', 'Failed webhook deliveries scheduled for a retry', ['route'])
+DELIVERY_DEAD = Counter('webhook_deliveries_dead_total', 'Webhook payloads that ran out of attempts', ['route'])
+
+
+class _Delivery:
+    __slots__ = ('key', 'route', 'payload', 'attempts')
+
+    def __init__(self, key, route, payload, attempts):
+        self.key = key
+        self.route = route
+        self.payload = payload
+        self.attempts = attempts
+
+
+class DeliveryQueue:
+    def __init__(self, path=DELIVERY_SPOOL_PATH, workers=DELIVERY_WORKERS, batch_size=DELIVERY_BATCH_SIZE,
+                 client=webhook_client):
+        self.path = path
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.client = client
+        self._sqlite = SQLiteDatabase(path, [
+            "CREATE TABLE IF NOT EXISTS deliveries (key TEXT PRIMARY KEY, route TEXT NOT NULL, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, "
+            "last_error TEXT, dead INTEGER NOT NULL DEFAULT 0)",
+            "CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (dead, next_attempt_at)"
+        ], 'delivery-sqlite')
+        self._connect = self._sqlite.connect
+        self._run = self._sqlite.run
+        self._tasks = []
+        self._wakeup = None
+        self._stopping = False
+        self._listeners = {}
+        # Refreshed after every spool write, for /metrics
+        self.pending = 0
+        self.dead = 0
+        self.sent = 0
+        self.retries = 0
+
+    def _count(self, db):
+        self.pending, self.dead = db.execute(
+            "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead), 0) FROM deliveries"
+        ).fetchone()
+
+    def _insert(self, key, route, payload):
+        db = self._connect()
+        now = time.time()
+        inserted = db.execute(
+            "INSERT OR IGNORE INTO deliveries (key, route, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, route, codec.dumps(payload), now, now)
+        ).rowcount
+        self._count(db)
+        return bool(inserted)
+
+    def _claim(self, limit):
+        # Take due rows for one route and lease them to the calling worker
+        db = self._connect()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT key, route, payload, attempts FROM deliveries WHERE dead = 0 AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?", (now, limit)
+            ).fetchall()
+            rows = [row for row in rows if row[1] == rows[0][1]] if rows else rows
+            db.executemany("UPDATE deliveries SET next_attempt_at = ? WHERE key = ?",
+                           [(now + DELIVERY_LEASE, row[0]) for row in rows])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return [_Delivery(key, route, codec.loads(payload), attempts) for key, route, payload, attempts in rows]
+
+    def _delete(self, keys):
+        db = self._connect()
+        db.executemany("DELETE FROM deliveries WHERE key = ?", [(key,) for key in keys])
+        self._count(db)
+
+    def _reschedule(self, deliveries, error):
+        # Returns the deliveries that ran out of attempts
+        db = self._connect()
+        now = time.time()
+        dead = []
+        updates = []
+        for delivery in deliveries:
+            attempts = delivery.attempts + 1
+            if attempts >= DELIVERY_MAX_ATTEMPTS:
+                dead.append(delivery)
+                updates.append((attempts, now, error, 1, delivery.key))
+            else:
+                delay = min(DELIVERY_MAX_BACKOFF, DELIVERY_BACKOFF * 2 ** (attempts - 1))
+                updates.append((attempts, now + random.uniform(delay / 2, delay), error, 0, delivery.key))
+        db.executemany("UPDATE deliveries SET attempts = ?, next_attempt_at = ?, last_error = ?, dead = ? WHERE key = ?",
+                       updates)
+        self._count(db)
+        return dead
+
+    def on_delivered(self, route, callback):
+        self._listeners.setdefault(route, []).append(callback)
+
+    async def enqueue(self, payload, key):
+        # Returns once the payload is on disk; False when the key was already spooled
+        inserted = await self._run(self._insert, key, payload.get('route'), {**payload, "idempotencyKey": key})
+        if not inserted:
+            logger.info('Delivery %s is already spooled', key)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return inserted
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        await self._run(lambda: self._count(self._connect()))
+        if self.pending:
+            logger.info('Resuming %d spooled webhook deliveries', self.pending)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=DELIVERY_DRAIN_TIMEOUT):
+        # Let in-flight sends finish; anything unsent stays in the spool
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks:
+            _, unfinished = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+            self._tasks = []
+        await self._sqlite.close()
+        if self.pending:
+            logger.warning('%d webhook deliveries left in %s for the next start', self.pending, self.path)
+
+    async def _work(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                batch = await self._run(self._claim, self.batch_size)
+            except Exception as e:
+                logger.error('Error reading the delivery spool: %s', e)
+                batch = None
+            if not batch:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                continue
+            await self._send(batch)
+
+    async def _send(self, batch):
+        route = batch[0].route
+        if len(batch) == 1:
+            payload = batch[0].payload
+            headers = {"Idempotency-Key": batch[0].key}
+        else:
+            payload = {"route": route, "batch": [delivery.payload for delivery in batch]}
+            headers = None
+        try:
+            response = await self.client.post(payload, headers)
+            error = None if response.ok else f"HTTP {response.status_code}"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        try:
+            if error is None:
+                await self._run(self._delete, [delivery.key for delivery in batch])
+                self.sent += len(batch)
+                DELIVERY_SENT.labels(route=route).inc(len(batch))
+                self._notify(route, batch)
+                return
+            dead = await self._run(self._reschedule, batch, error)
+        except Exception as e:
+            # The lease runs out and the batch is sent again
+            logger.error('Error updating the delivery spool: %s', e)
+            return
+        retried = len(batch) - len(dead)
+        self.retries += retried
+        if retried:
+            DELIVERY_RETRIES.labels(route=route).inc(retried)
+            logger.warning('Webhook delivery of %d route %s payloads failed, will retry: %s', retried, route, error)
+        for delivery in dead:
+            DELIVERY_DEAD.labels(route=route).inc()
+            logger.error('Giving up on webhook delivery %s after %d attempts: %s', delivery.key,
+                         delivery.attempts + 1, error)
+
+    def _notify(self, route, batch):
+        for callback in self._listeners.get(route, ()):
+            for delivery in batch:
+                try:
+                    callback(delivery.payload)
+                except Exception as e:
+                    logger.error('Error in delivery callback for %s: %s', delivery.key, e)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "dead": self.dead,
+            "sent": self.sent,
+            "retries": self.retries,
+            "workers": len(self._tasks),
+            "batchSize": self.batch_size
+        }
+
+
+delivery_queue = DeliveryQueue()
@@ -0,0 +1,220 @@
+# Filler audio played while a slow tool call is pending.
+#
+# When a tool has not answered after FILLER_DELAY seconds, a short phrase
+# ("let me check that for you") and then a looping hold tone are streamed
+# straight to Twilio as media events, so the caller does not sit in dead air.
+# The clips are g711 u-law, ready to send: raw .ulaw/.raw files or u-law .wav
+# files from FILLER_AUDIO_DIR are memory-mapped at startup, and a soft hold
+# tone is synthesized when the directory has none. No Realtime API round trip
+# is involved. Files named hold* loop; every other file is a phrase, used in
+# turn. The filler stops as soon as the tool result arrives or the caller
+# speaks, and Twilio's buffer is cleared unless agent audio is queued behind
+# the filler; then the few frames sent ahead play out instead.
+import asyncio
+import base64
+import contextlib
+import itertools
+import logging
+import math
+import mmap
+import os
+import time
+
+import codec
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+FILLER_ENABLED = os.getenv('FILLER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+FILLER_DELAY = float(os.getenv('FILLER_DELAY', 1.0))
+FILLER_AUDIO_DIR = os.getenv('FILLER_AUDIO_DIR')
+
+# 20 ms of 8 kHz u-law, the frame size Twilio sends
+FRAME_BYTES = 160
+FRAME_SECONDS = 0.02
+# Frames sent ahead of real time, so playback never starves
+LEAD_FRAMES = 5
+
+FILLER_SECONDS = Counter('filler_audio_seconds_total', 'Filler audio streamed while tools were pending')
+
+
+def linear_to_ulaw(sample):
+    # G.711 u-law encoding of a signed 16-bit sample
+    sign = 0x80 if sample < 0 else 0
+    magnitude = min(abs(sample), 32635) + 0x84
+    exponent = max(0, ((magnitude >> 7) & 0xFF).bit_length() - 1)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+def hold_tone(frequency=440, tone_seconds=0.35, period_seconds=2.0, amplitude=2500, rate=8000):
+    # A quiet beep followed by silence, to loop while the caller waits
+    samples = bytearray()
+    for i in range(int(period_seconds * rate)):
+        value = 0
+        if i < tone_seconds * rate:
+            # 20 ms fades avoid clicks
+            fade = min(1.0, i / 160, (tone_seconds * rate - i) / 160)
+            value = int(amplitude * fade * math.sin(2 * math.pi * frequency * i / rate))
+        samples.append(linear_to_ulaw(value))
+    return bytes(samples)
+
+
+def _wav_data(data, path):
+    # Offset and length of the sample data in a u-law (format 7) WAV file
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError(f"{path} is not a WAV file")
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        if chunk_id == b'fmt ':
+            audio_format = int.from_bytes(data[offset + 8:offset + 10], 'little')
+            sample_rate = int.from_bytes(data[offset + 12:offset + 16], 'little')
+            if audio_format != 7 or sample_rate != 8000:
+                raise ValueError(f"{path} must be 8 kHz u-law")
+        elif chunk_id == b'data':
+            return offset + 8, min(size, len(data) - offset - 8)
+        offset += 8 + size + (size & 1)
+    raise ValueError(f"{path} has no data chunk")
+
+
+class Clip:
+    def __init__(self, name, data, start=0, length=None):
+        self.name = name
+        # bytes, or a memory-mapped file
+        self._data = data
+        self._start = start
+        self._length = len(data) - start if length is None else length
+        # In-memory clips are encoded once; mapped files are encoded as they are sent
+        self._frames = self._encode() if isinstance(data, bytes) else None
+
+    @property
+    def seconds(self):
+        return self._length / 8000
+
+    def _encode(self):
+        end = self._start + self._length
+        return [base64.b64encode(self._data[offset:min(offset + FRAME_BYTES, end)]).decode('ascii')
+                for offset in range(self._start, end, FRAME_BYTES)]
+
+    def frames(self):
+        if self._frames is not None:
+            return iter(self._frames)
+        end = self._start + self._length
+        return (base64.b64encode(self._data[offset:min(offset + FRAME_BYTES, end)]).decode('ascii')
+                for offset in range(self._start, end, FRAME_BYTES))
+
+
+class FillerLibrary:
+    def __init__(self, directory=FILLER_AUDIO_DIR):
+        self.phrases = []
+        self.hold = None
+        self._mapped = []
+        if directory:
+            self._load(directory)
+        if self.hold is None:
+            self.hold = Clip('hold-tone', hold_tone())
+        self._next_phrase = itertools.cycle(self.phrases) if self.phrases else None
+
+    def _load(self, directory):
+        for filename in sorted(os.listdir(directory)):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() not in ('.ulaw', '.raw', '.wav'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                start, length = _wav_data(data, path) if extension.lower() == '.wav' else (0, len(data))
+            except (OSError, ValueError) as e:
+                logger.error('Skipping filler clip %s: %s', path, e)
+                continue
+            self._mapped.append(data)
+            clip = Clip(stem, data, start, length)
+            if stem.lower().startswith('hold'):
+                self.hold = clip
+            else:
+                self.phrases.append(clip)
+        logger.info('Loaded %d filler phrases from %s', len(self.phrases), directory)
+
+    def sequence(self):
+        # One phrase, then the hold clip until stopped
+        if self._next_phrase is not None:
+            yield next(self._next_phrase)
+        while True:
+            yield self.hold
+
+    def close(self):
+        for data in self._mapped:
+            data.close()
+        self._mapped = []
+
+
+class FillerPlayer:
+    # One per call. is_busy reports agent audio still queued or playing,
+    # which the filler must not talk over.
+    def __init__(self, send_text, stream_sid, is_busy, library=None, delay=FILLER_DELAY):
+        self.send_text = send_text
+        self.stream_sid = stream_sid
+        self.is_busy = is_busy
+        self.library = library
+        self.delay = delay
+        self._task = None
+        self._sent = 0
+        self.played = 0
+        self.seconds_total = 0.0
+
+    def start(self):
+        if self.library is None or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._play())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        if self._sent:
+            # Drop the filler Twilio has buffered but not played yet
+            seconds = self._sent * FRAME_SECONDS
+            self._sent = 0
+            self.seconds_total += seconds
+            FILLER_SECONDS.inc(seconds)
+            if self.is_busy():
+                # A clear would also drop the agent audio queued behind the
+                # filler, and Twilio would acknowledge its marks as played
+                return
+            try:
+                await self.send_text(codec.dumps({"event": "clear", "streamSid": self.stream_sid()}))
+            except Exception as e:
+                # The call is already over
+                logger.debug('Could not clear filler audio: %s', e)
+
+    async def _play(self):
+        await asyncio.sleep(self.delay)
+        while self.is_busy():
+            await asyncio.sleep(FRAME_SECONDS)
+        self.played += 1
+        logger.debug('Playing filler audio while a tool call is pending')
+        started = time.monotonic()
+        stream_sid = self.stream_sid()
+        try:
+            for clip in self.library.sequence():
+                for frame in clip.frames():
+                    # Pace to real time, a few frames ahead
+                    ahead = started + (self._sent - LEAD_FRAMES) * FRAME_SECONDS - time.monotonic()
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+                    await self.send_text(codec.twilio_media(stream_sid, frame))
+                    self._sent += 1
+        except Exception as e:
+            # The caller hung up while the tool was still running
+            logger.debug('Stopped filler audio: %s', e)
+
+    def stats(self):
+        return {"played": self.played, "seconds": round(self.seconds_total, 2)}
+
+
+filler_library = FillerLibrary() if FILLER_ENABLED else None
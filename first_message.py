@@ -0,0 +1,165 @@
+# Personalized first message lookup for incoming calls.
+#
+# /incoming-call starts the N8N route "1" request and returns TwiML straight
+# away; the lookup runs while Twilio opens the media stream. When the stream's
+# start event arrives, the media stream waits for the in-flight result keyed
+# by CallSid, up to FIRST_MESSAGE_DEADLINE, before falling back to the default
+# greeting. The stats record how much of the webhook latency was hidden
+# behind the stream setup.
+#
+# Repeat callers are answered from the caller cache with no webhook request.
+#
+# With a shared session backend the result is also written to the call's
+# record, so a media stream on another worker can poll for it.
+import asyncio
+import logging
+import os
+import time
+
+from caller_cache import caller_cache
+from metrics import FIRST_MESSAGE_SAVED, FIRST_MESSAGE_WAIT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIRST_MESSAGE = "Hey, this is Sara from Agenix AI solutions. How can I assist you today?"
+FIRST_MESSAGE_DEADLINE = float(os.getenv('FIRST_MESSAGE_DEADLINE', 2.0))
+# Lookups whose media stream never connects are dropped after this many seconds
+PENDING_TTL = 60
+# How often a media stream on another worker checks the shared record
+BACKEND_POLL_INTERVAL = 0.05
+
+
+async def fetch_first_message(caller_number):
+    context = await caller_cache.load(caller_number)
+    return context['firstMessage'] if context else DEFAULT_FIRST_MESSAGE
+
+
+class _PendingFetch:
+    __slots__ = ('task', 'started_at', 'finished_at')
+
+    def __init__(self, task, started_at):
+        self.task = task
+        self.started_at = started_at
+        self.finished_at = None
+
+
+class FirstMessageFetcher:
+    def __init__(self, deadline=FIRST_MESSAGE_DEADLINE, backend=None):
+        self.deadline = deadline
+        self.backend = backend
+        self._pending = {}
+        self.started = 0
+        self.resolved = 0
+        self.ready_at_start = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.missing = 0
+        self.from_backend = 0
+        self.from_cache = 0
+        self.saved_seconds_total = 0.0
+        self.waited_seconds_total = 0.0
+
+    def start(self, call_sid, caller_number):
+        context = caller_cache.get(caller_number)
+        if context is not None:
+            task = asyncio.get_running_loop().create_future()
+            task.set_result(context['firstMessage'])
+            self.from_cache += 1
+        else:
+            task = asyncio.create_task(fetch_first_message(caller_number))
+        pending = _PendingFetch(task, time.monotonic())
+        pending.task.add_done_callback(lambda task: self._finished(call_sid, pending, task))
+        self._pending[call_sid] = pending
+        self.started += 1
+        asyncio.get_running_loop().call_later(PENDING_TTL, self._expire, call_sid, pending)
+
+    async def wait(self, call_sid):
+        pending = self._pending.pop(call_sid, None)
+        if pending is None and self.backend is not None and self.backend.shared:
+            first_message = await self._poll_backend(call_sid)
+            if first_message:
+                self.from_backend += 1
+                return first_message
+        if pending is None:
+            self.missing += 1
+            logger.warning('No first message lookup in flight for %s, using default greeting', call_sid)
+            return DEFAULT_FIRST_MESSAGE
+
+        start_event_at = time.monotonic()
+        self.resolved += 1
+        if pending.task.done():
+            self.ready_at_start += 1
+        try:
+            first_message = await asyncio.wait_for(asyncio.shield(pending.task), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning('First message lookup for %s missed the %ss deadline, using default greeting', call_sid, self.deadline)
+            first_message = DEFAULT_FIRST_MESSAGE
+        waited = time.monotonic() - start_event_at
+
+        # Before, the whole lookup ran ahead of the TwiML response. Now only the
+        # part still outstanding at the start event delays the greeting.
+        finished_at = pending.finished_at or time.monotonic()
+        saved = min(finished_at, start_event_at) - pending.started_at
+        if waited > 0.001:
+            self.waited += 1
+        self.saved_seconds_total += saved
+        self.waited_seconds_total += waited
+        FIRST_MESSAGE_SAVED.observe(saved)
+        FIRST_MESSAGE_WAIT.observe(waited)
+        logger.info('First message for %s: lookup %.3fs, waited %.3fs at stream start, saved %.3fs',
+                    call_sid, finished_at - pending.started_at, waited, saved)
+        return first_message
+
+    def stats(self):
+        resolved = self.resolved
+        return {
+            "inFlight": len(self._pending),
+            "started": self.started,
+            "resolved": self.resolved,
+            "readyAtStreamStart": self.ready_at_start,
+            "waitedAtStreamStart": self.waited,
+            "timeouts": self.timeouts,
+            "missing": self.missing,
+            "fromBackend": self.from_backend,
+            "fromCache": self.from_cache,
+            "deadlineSeconds": self.deadline,
+            "savedSecondsTotal": self.saved_seconds_total,
+            "avgSavedSeconds": self.saved_seconds_total / resolved if resolved else 0.0,
+            "avgWaitedSeconds": self.waited_seconds_total / resolved if resolved else 0.0
+        }
+
+    def _finished(self, call_sid, pending, task):
+        pending.finished_at = time.monotonic()
+        if self.backend is not None and self.backend.shared and not task.cancelled():
+            asyncio.create_task(self._publish(call_sid, task.result()))
+
+    async def _publish(self, call_sid, first_message):
+        try:
+            # Keeps the record's expiry; a call already released stays released
+            await self.backend.update(call_sid, {"firstMessage": first_message})
+        except Exception as e:
+            logger.error('Error publishing first message for %s: %s', call_sid, e)
+
+    # The lookup was started by another worker; wait for it to publish the result
+    async def _poll_backend(self, call_sid):
+        deadline = time.monotonic() + self.deadline
+        while True:
+            try:
+                record = await self.backend.get(call_sid)
+                if record and record.get('firstMessage'):
+                    return record['firstMessage']
+            except Exception as e:
+                logger.error('Error reading first message for %s from backend: %s', call_sid, e)
+                return None
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(BACKEND_POLL_INTERVAL)
+
+    def _expire(self, call_sid, pending):
+        if self._pending.get(call_sid) is pending:
+            del self._pending[call_sid]
+            pending.task.cancel()
+
+
+first_message_fetcher = FirstMessageFetcher()
@@ -0,0 +1,213 @@
+# Call admission, drain mode and graceful shutdown.
+#
+# /incoming-call asks admit() before connecting a call. A call holds a slot
+# from admission until its media stream ends (a stream that never connects
+# gives the slot back after ADMISSION_TTL). Past MAX_CONCURRENT_CALLS, extra
+# callers either hear a hold message and are retried every CALL_QUEUE_PAUSE
+# seconds for up to CALL_QUEUE_TIMEOUT (CALL_OVERFLOW=queue), or get a busy
+# signal (CALL_OVERFLOW=reject). The limit is per worker process.
+#
+# In drain mode new calls are turned away while calls in progress, including
+# admitted calls whose stream has not connected yet, carry on. /ready reports
+# 503 while draining or full, so a load balancer or autoscaler stops sending
+# calls here. SIGTERM or SIGINT starts a drain under DrainingServer; the
+# process exits once the last call ends or DRAIN_TIMEOUT passes, and a second
+# signal exits at once. Calls cut off at exit still have their transcripts
+# handed to the delivery spool by flush().
+import logging
+import os
+import time
+from urllib.parse import urlencode
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# 0 means no limit
+MAX_CONCURRENT_CALLS = int(os.getenv('MAX_CONCURRENT_CALLS', 0))
+# queue or reject
+CALL_OVERFLOW = os.getenv('CALL_OVERFLOW', 'queue')
+CALL_QUEUE_TIMEOUT = float(os.getenv('CALL_QUEUE_TIMEOUT', 60))
+CALL_QUEUE_PAUSE = int(os.getenv('CALL_QUEUE_PAUSE', 5))
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', 600))
+# Seconds an admitted call has to start its media stream
+ADMISSION_TTL = 30
+
+ADMIT = 'admit'
+QUEUE = 'queue'
+REJECT = 'reject'
+
+HOLD_MESSAGE = "All of our lines are busy right now. Please hold and we'll be with you shortly."
+UNAVAILABLE_MESSAGE = "Sorry, we can't take your call right now. Please try again later."
+
+CALLS_ADMITTED = Counter('calls_admitted_total', 'Calls admitted at /incoming-call')
+CALLS_QUEUED = Counter('calls_queued_total', 'Admission attempts answered with a hold message')
+CALLS_REJECTED = Counter('calls_rejected_total', 'Calls turned away at /incoming-call', ['reason'])
+
+
+class CallLifecycle:
+    def __init__(self, max_calls=MAX_CONCURRENT_CALLS, overflow=CALL_OVERFLOW, queue_timeout=CALL_QUEUE_TIMEOUT):
+        self.max_calls = max_calls
+        self.overflow = overflow
+        self.queue_timeout = queue_timeout
+        # CallSid -> deadline for the media stream to start
+        self._admitted = {}
+        # CallSid -> coroutine function that wraps up the call
+        self._active = {}
+        self.draining = False
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.flushed = 0
+
+    @property
+    def calls(self):
+        now = time.monotonic()
+        for call_sid in [sid for sid, deadline in self._admitted.items() if deadline <= now]:
+            del self._admitted[call_sid]
+        return len(self._active) + len(self._admitted)
+
+    def available(self):
+        # Free slots, or None without a limit
+        if not self.max_calls:
+            return None
+        return max(0, self.max_calls - self.calls)
+
+    @property
+    def ready(self):
+        return not self.draining and self.available() != 0
+
+    def admit(self, call_sid, queued_for=0.0):
+        # Returns ADMIT, QUEUE or REJECT
+        if self.draining:
+            return self._reject('draining')
+        if call_sid in self._admitted or call_sid in self._active:
+            return ADMIT
+        if self.available() == 0:
+            if self.overflow == QUEUE and queued_for < self.queue_timeout:
+                self.queued += 1
+                CALLS_QUEUED.inc()
+                return QUEUE
+            return self._reject('full')
+        self._admitted[call_sid] = time.monotonic() + ADMISSION_TTL
+        self.admitted += 1
+        CALLS_ADMITTED.inc()
+        return ADMIT
+
+    def _reject(self, reason):
+        self.rejected += 1
+        CALLS_REJECTED.labels(reason=reason).inc()
+        return REJECT
+
+    def started(self, call_sid, finish):
+        # Streams arriving on another worker than their admission are counted too
+        self._admitted.pop(call_sid, None)
+        self._active[call_sid] = finish
+
+    def ended(self, call_sid):
+        self._active.pop(call_sid, None)
+
+    def drain(self):
+        if not self.draining:
+            self.draining = True
+            logger.info('Draining: no new calls, %d in progress', self.calls)
+
+    async def flush(self):
+        # Wrap up calls still open at shutdown so their transcripts are spooled
+        for call_sid, finish in list(self._active.items()):
+            try:
+                await finish()
+                self.flushed += 1
+            except Exception as e:
+                logger.error('Error flushing call %s at shutdown: %s', call_sid, e)
+        self._active.clear()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "calls": self.calls,
+            "streaming": len(self._active),
+            "maxCalls": self.max_calls,
+            "available": self.available(),
+            "overflow": self.overflow,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "flushed": self.flushed
+        }
+
+
+def queue_twiml(params, first_attempt):
+    # Hold, then ask /incoming-call again with the same parameters
+    say = f"<Say>{HOLD_MESSAGE}</Say>" if first_attempt else ""
+    url = "/incoming-call?" + urlencode(params).replace('&', '&amp;')
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    {say}<Pause length="{CALL_QUEUE_PAUSE}" />
+    <Redirect method="POST">{url}</Redirect>
+</Response>"""
+
+
+def reject_twiml(answered):
+    # A busy signal, unless the caller was already answered with a hold message
+    if not answered:
+        return """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Reject reason="busy" />
+</Response>"""
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say>{UNAVAILABLE_MESSAGE}</Say>
+    <Hangup />
+</Response>"""
+
+
+class DrainingServer(uvicorn.Server):
+    # The first SIGTERM/SIGINT drains instead of closing every media stream
+    # at once; uvicorn's own shutdown runs when the calls are done
+    def __init__(self, config, lifecycle=None, drain_timeout=DRAIN_TIMEOUT):
+        super().__init__(config)
+        self._lifecycle = lifecycle
+        self.drain_timeout = drain_timeout
+        self._drain_deadline = None
+
+    @property
+    def lifecycle(self):
+        # Looked up on use: worker processes get a pickled copy of the server,
+        # and only the module instance is the one the app updates
+        return self._lifecycle or call_lifecycle
+
+    def handle_exit(self, sig, frame):
+        if self._drain_deadline is not None or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        # Runs in the signal handler; on_tick does the rest on the event loop
+        self._drain_deadline = time.monotonic() + self.drain_timeout
+
+    async def on_tick(self, counter):
+        if self._drain_deadline is not None and not self.should_exit:
+            self.lifecycle.drain()
+            if self.lifecycle.calls == 0:
+                self.should_exit = True
+            elif time.monotonic() >= self._drain_deadline:
+                logger.warning('Drain timeout: ending %d calls in progress', self.lifecycle.calls)
+                self.should_exit = True
+            elif counter % 100 == 0:
+                logger.info('Draining: waiting for %d calls to end', self.lifecycle.calls)
+        return await super().on_tick(counter)
+
+
+def run(config):
+    # uvicorn.run() with DrainingServer, for one or several workers
+    server = DrainingServer(config)
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+call_lifecycle = CallLifecycle()
@@ -0,0 +1,156 @@
+# Non-blocking structured logging for the call hot path.
+#
+# Loggers only put records on a bounded queue; a background thread formats
+# them and writes to stdout, so a slow terminal or log collector never holds
+# up the audio relay. Records are formatted by the writer thread, which means
+# a line below the configured level, or one dropped by sampling, costs only
+# the level check. Pass payloads as %-style arguments instead of pre-formatting
+# them.
+#
+# Every record carries the CallSid and streamSid of the call it was logged
+# from (see bind_call), and high-frequency events logged with extra=SAMPLED
+# are kept once every LOG_SAMPLE_EVERY occurrences.
+import atexit
+import contextvars
+import itertools
+import logging
+import os
+import queue
+import sys
+import time
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+import codec
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Per-logger overrides, e.g. "main.events=DEBUG,session_store=WARNING"
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+# "text" for the console, "json" for one JSON object per line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 20))
+
+# Libraries that log every frame or request at DEBUG; LOG_LEVELS overrides these
+QUIET_LOGGERS = {'websockets': 'INFO', 'urllib3': 'INFO', 'httpcore': 'INFO', 'multipart': 'INFO', 'charset_normalizer': 'INFO'}
+
+# Pass as extra= for events that fire many times per call
+SAMPLED = {'sampled': True}
+
+# Fields of the call being handled by the current task
+_call = contextvars.ContextVar('call', default=None)
+
+_listener = None
+dropped = 0
+sampled_out = 0
+
+
+def bind_call(**fields):
+    # Returns the dict so later fields (streamSid after the start event) can
+    # be filled in and seen by every task created after this call
+    call = dict(fields)
+    _call.set(call)
+    return call
+
+
+class _CallFilter(logging.Filter):
+    def __init__(self, sample_every):
+        super().__init__()
+        self.sample_every = sample_every
+        self._seen = {}
+
+    def filter(self, record):
+        global sampled_out
+        if getattr(record, 'sampled', False) and self.sample_every > 1:
+            key = (record.name, record.msg)
+            counter = self._seen.get(key)
+            if counter is None:
+                counter = self._seen[key] = itertools.count()
+            if next(counter) % self.sample_every:
+                sampled_out += 1
+                return False
+        call = _call.get()
+        record.call_sid = call.get('call_sid') if call else None
+        record.stream_sid = call.get('stream_sid') if call else None
+        return True
+
+
+class _AsyncHandler(QueueHandler):
+    def prepare(self, record):
+        # Leave msg and args for the writer thread; only the traceback has
+        # to be captured now, while it is still current
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        call = ''
+        if record.call_sid or record.stream_sid:
+            call = f" [{record.call_sid or '-'} {record.stream_sid or '-'}]"
+        line = (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))} "
+                f"{record.levelname} {record.name}{call}: {record.getMessage()}")
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.call_sid:
+            entry["callSid"] = record.call_sid
+        if record.stream_sid:
+            entry["streamSid"] = record.stream_sid
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return codec.dumps(entry)
+
+
+def setup(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT):
+    global _listener
+    if _listener is not None:
+        return
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JSONFormatter() if fmt == 'json' else TextFormatter())
+    handler = _AsyncHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(_CallFilter(LOG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    for name, name_level in QUIET_LOGGERS.items():
+        logging.getLogger(name).setLevel(name_level)
+    for override in filter(None, (item.strip() for item in levels.split(','))):
+        name, _, name_level = override.partition('=')
+        logging.getLogger(name.strip()).setLevel(name_level.strip().upper())
+
+    _listener = QueueListener(handler.queue, writer)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    # Writes out everything still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    return {"dropped": dropped, "sampledOut": sampled_out}
@@ -1,30 +1,86 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Response
-from pinecone_plugins.assistant.models.chat import Message
-from fastapi.responses import Response
-from pinecone import Pinecone
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
 from prompts import SYSTEM_MESSAGE
-import websockets
-import requests
+from webhooks import webhook_client
+from answer_cache import answer_cache
+from caller_cache import caller_cache
+from realtime_pool import RealtimePool
+from first_message import first_message_fetcher
+from session_store import session_store
+from delivery import delivery_queue
+from lifecycle import call_lifecycle
+import codec
+import lifecycle
+import logs
+import metrics
+import relay
+import session_config
+import tools
+from filler import FillerPlayer, filler_library
+from playback import PlaybackTracker, audio_ms
+from metrics import AUDIO_FRAMES, OPENAI_CONNECT, RESPONSE_LATENCY, TIME_TO_FIRST_AUDIO
+import rag
 import asyncio
-import json
+import logging
 import time
 import os
 
-# Retrieve the OpenAI API key and N8N webhook URL from environment variables
+# Logging goes through a queue to a background writer so the event loop never
+# blocks on stdout
+logs.setup()
+logger = logging.getLogger('main')
+# Raw OpenAI events, at DEBUG and sampled
+event_logger = logging.getLogger('main.events')
+
+# Retrieve the OpenAI API key and other settings from environment variables
+# (the N8N webhook URL is read by webhooks.py)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 REPL_PUBLIC_URL = os.getenv("REPL_PUBLIC_URL")
-
-# Initialize FastAPI app
-app = FastAPI()
+# Public URL of this node, so a call's media stream returns to the node that answered it
+STREAM_PUBLIC_URL = os.getenv("NODE_PUBLIC_URL") or REPL_PUBLIC_URL
 
 # Some default constants used throughout the application
 VOICE = 'shimmer'  # The voice for AI responses
 PORT = int(os.getenv('PORT', 8000))
+WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# OpenAI Realtime API connection settings
+OPENAI_REALTIME_URL = os.getenv('OPENAI_REALTIME_URL', 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01')
+OPENAI_REALTIME_HEADERS = {
+    'Authorization': f'Bearer {OPENAI_API_KEY}',
+    'OpenAI-Beta': 'realtime=v1'
+}
+
+# The default persona; others can be registered with session_config.register_persona
+session_config.register_persona(session_config.DEFAULT_PERSONA, SYSTEM_MESSAGE, VOICE)
+
+# Pre-connected OpenAI Realtime sessions ready to be taken by new calls
+realtime_pool = RealtimePool(OPENAI_REALTIME_URL, OPENAI_REALTIME_HEADERS, session_config.session_update)
+
+# Once a caller's transcript reaches N8N, their cached greeting is refreshed in the background
+delivery_queue.on_delivered("2", lambda payload: caller_cache.revalidate(payload.get('number')))
+
+# Start and stop shared resources with the application
+@asynccontextmanager
+async def lifespan(_app):
+    first_message_fetcher.backend = session_store.backend
+    await realtime_pool.start()
+    await delivery_queue.start()
+    yield
+    await realtime_pool.stop()
+    # Transcripts of calls cut off by the shutdown go to the spool first
+    await call_lifecycle.flush()
+    await delivery_queue.stop()
+    webhook_client.close()
+    rag.shutdown()
+    if filler_library is not None:
+        filler_library.close()
+    await session_store.backend.close()
+    logs.shutdown()
 
-# Session management: Store session data for ongoing calls
-sessions = {} 
+# Initialize FastAPI app
+app = FastAPI(lifespan=lifespan)
 
 # Event types to log to the console for debugging purposes
 LOG_EVENT_TYPES = [
@@ -44,66 +100,129 @@ LOG_EVENT_TYPES = [
 async def root():
     return {"message": "Twilio Media Stream Server is running!"}
 
+# Report question_and_answer cache usage
+@app.get("/cache/answers")
+async def answer_cache_stats():
+    return answer_cache.stats()
+
+# Invalidate one cached answer, or the whole cache when no question is given
+@app.delete("/cache/answers")
+async def invalidate_answer_cache(question: str = None):
+    removed = answer_cache.invalidate(question)
+    return {"removed": removed, **answer_cache.stats()}
+
+# Report caller context cache usage
+@app.get("/cache/callers")
+async def caller_cache_stats():
+    return caller_cache.stats()
+
+# Invalidate one caller's cached context, or the whole cache when no number is given
+@app.delete("/cache/callers")
+async def invalidate_caller_cache(number: str = None):
+    removed = caller_cache.invalidate(number)
+    return {"removed": removed, **caller_cache.stats()}
+
+# Readiness and call capacity, for load balancers and autoscaling;
+# 503 while draining or at MAX_CONCURRENT_CALLS
+@app.get("/ready")
+async def ready():
+    stats = call_lifecycle.stats()
+    return JSONResponse(stats, status_code=200 if stats['ready'] else 503)
+
+# Report OpenAI Realtime pool usage and time to first greeting
+@app.get("/realtime-pool")
+async def realtime_pool_stats():
+    return realtime_pool.stats()
+
+# Report how much first message lookup latency overlapped with stream setup
+@app.get("/first-message")
+async def first_message_stats():
+    return first_message_fetcher.stats()
+
+# Report live call sessions and their approximate memory use
+@app.get("/sessions")
+async def session_stats():
+    return await session_store.stats()
+
+# Report relay queue depth and drops for each call on this worker
+@app.get("/relay")
+async def relay_stats():
+    return relay.stats()
+
+# Report spooled webhook deliveries
+@app.get("/delivery")
+async def delivery_stats():
+    return delivery_queue.stats()
+
+# Gauges read from the live objects when /metrics is scraped
+metrics.Gauge('realtime_pool_idle_sessions', 'Idle pre-configured OpenAI Realtime sessions',
+              function=lambda: realtime_pool.stats()['idle'])
+metrics.Gauge('call_sessions_live', 'Call sessions held by this worker', function=lambda: len(session_store))
+metrics.Gauge('answer_cache_entries', 'Cached question_and_answer results', function=lambda: answer_cache.stats()['entries'])
+metrics.Gauge('caller_cache_entries', 'Cached caller contexts from N8N route "1"', function=lambda: caller_cache.stats()['entries'])
+metrics.Gauge('calls_in_progress', 'Admitted and streaming calls on this worker', function=lambda: call_lifecycle.calls)
+metrics.Gauge('log_records_dropped', 'Log records dropped because the log queue was full', function=lambda: logs.dropped)
+metrics.Gauge('webhook_deliveries_pending', 'Webhook payloads waiting in the delivery spool',
+              function=lambda: delivery_queue.pending)
+
+# Expose latency histograms and counters in the Prometheus text format
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Handle incoming calls from Twilio
 @app.post("/incoming-call")
 async def incoming_call(request: Request):
     form_data = await request.form()
     twilio_params = dict(form_data)
-    print('Incoming call')
-    print('Twilio Inbound Details:', json.dumps(twilio_params, indent=2))
-
     caller_number = twilio_params.get('From', 'Unknown')
     session_id = twilio_params.get('CallSid')
-    print('Caller Number:', caller_number)
-    print('Session ID (CallSid):', session_id)
-
-    # Send the caller's number to N8N webhook to get a personalized first message
-    first_message = "Hey, this is Sara from Agenix AI solutions. How can I assist you today?"
-
+    # Chosen in the Twilio webhook URL, e.g. /incoming-call?persona=sales
+    persona = request.query_params.get('persona')
+    if persona not in session_config.PERSONAS:
+        persona = session_config.DEFAULT_PERSONA
+    logs.bind_call(call_sid=session_id)
+    logger.info('Incoming call from %s', caller_number)
+    logger.debug('Twilio inbound details: %s', twilio_params)
+
+    # Past the concurrent call limit the caller is put on hold and retried,
+    # or turned away; while draining every new call is turned away
+    queued_since = request.query_params.get('queued')
     try:
-        webhook_response = requests.post(
-            N8N_WEBHOOK_URL,
-            headers={"Content-Type": "application/json"},
-            json={
-                "route": "1",
-                "number": caller_number,
-                "data": "empty"
-            }
-        )
-        if webhook_response.ok:
-            response_text = webhook_response.text
-            try:
-                response_data = json.loads(response_text)
-                if response_data and response_data.get('firstMessage'):
-                    first_message = response_data['firstMessage']
-                    print('Parsed firstMessage from N8N:', first_message)
-            except json.JSONDecodeError:
-                first_message = response_text.strip()
-        else:
-            print(f"Failed to send data to N8N webhook: {webhook_response.status_code}")
+        queued_for = time.time() - float(queued_since) if queued_since else 0.0
+    except ValueError:
+        queued_for = 0.0
+    admission = call_lifecycle.admit(session_id, queued_for)
+    if admission == lifecycle.QUEUE:
+        logger.info('At capacity, holding call from %s', caller_number)
+        params = {"persona": persona, "queued": queued_since or f"{time.time():.0f}"}
+        return Response(content=lifecycle.queue_twiml(params, queued_since is None), media_type="text/xml")
+    if admission == lifecycle.REJECT:
+        logger.warning('Turning away call from %s (draining: %s)', caller_number, call_lifecycle.draining)
+        return Response(content=lifecycle.reject_twiml(queued_since is not None), media_type="text/xml")
+
+    # Set up a new session for this call and share it with the other workers
+    session = session_store.create(session_id, caller_number, twilio_params)
+    try:
+        await session_store.publish(session)
     except Exception as e:
-        print(f"Error sending data to N8N webhook: {e}")
-
-    # Set up a new session for this call
-    session = {
-        "transcript": "",
-        "streamSid": None,
-        "callerNumber": caller_number,
-        "callDetails": twilio_params,
-        "firstMessage": first_message
-    }
-    sessions[session_id] = session
-
-    # Get Replit's public URL from environment variable
-    host = REPL_PUBLIC_URL
+        logger.error('Error publishing session %s: %s', session_id, e)
+
+    # Look up the personalized first message in the background; the media
+    # stream picks up the result by CallSid once Twilio connects
+    first_message_fetcher.start(session_id, caller_number)
+
+    # Point the stream at this node when it has its own public URL, otherwise
+    # at Replit's public URL
+    host = STREAM_PUBLIC_URL
     stream_url = f"{host.replace('https', 'wss')}/media-stream"
 
     twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
     <Connect>
         <Stream url="{stream_url}">
-            <Parameter name="firstMessage" value="{first_message}" />
             <Parameter name="callerNumber" value="{caller_number}" />
+            <Parameter name="persona" value="{persona}" />
         </Stream>
     </Connect>
 </Response>"""
@@ -114,279 +233,209 @@ async def incoming_call(request: Request):
 @app.websocket("/media-stream")
 async def media_stream(websocket: WebSocket):
     await websocket.accept()
-    print('Client connected to media-stream')
+    connected_at = time.monotonic()
+    # Filled in at the start event; every task below logs with these fields
+    call_fields = logs.bind_call()
+    logger.info('Client connected to media-stream')
 
     first_message = ''
     stream_sid = ''
     openai_ws_ready = False
     queued_first_message = None
     thread_id = ''
-
-    # Use a unique session ID per connection
-    session_id = f"session_{int(time.time())}"
-    session = sessions.get(session_id)
-    if not session:
-        session = {'transcript': '', 'streamSid': None}
-        sessions[session_id] = session
-
-    caller_number = session.get('callerNumber', 'Unknown')
-    print('Caller Number:', caller_number)
-
-    # Open a WebSocket connection to the OpenAI Realtime API
-    openai_ws_url = 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01'
-    openai_ws_headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'OpenAI-Beta': 'realtime=v1'
-    }
-
-    async def send_session_update(openai_ws):
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "turn_detection": {"type": "server_vad"},
-                "input_audio_format": "g711_ulaw",
-                "output_audio_format": "g711_ulaw",
-                "voice": VOICE,
-                "instructions": SYSTEM_MESSAGE,
-                "modalities": ["text", "audio"],
-                "temperature": 0.8,
-                "input_audio_transcription": {
-                    "model": "whisper-1"
-                },
-                "tools": [
-                    {
-                        "type": "function",
-                        "name": "question_and_answer",
-                        "description": "Get answers to customer questions especially about AI employees",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "question": {"type": "string"}
-                            },
-                            "required": ["question"]
-                        }
-                    },
-                    {
-                        "type": "function",
-                        "name": "schedule_meeting",
-                        "description": "Schedule a meeting for a customer. Returns a message indicating whether the booking was successful or not.",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "name": {"type": "string"},
-                                "email": {"type": "string"},
-                                "purpose": {"type": "string"},
-                                "datetime": {"type": "string"},
-                                "location": {"type": "string"}
-                            },
-                            "required": ["name", "email", "purpose", "datetime", "location"]
-                        }
-                    }
-                ],
-                "tool_choice": "auto"
-            }
-        }
-        print('Sending session update:', json.dumps(session_update))
-        await openai_ws.send(json.dumps(session_update))
+    greeted = False
+    # Set when Twilio's start event arrives, for time to first audio
+    started_at = None
+    # How much agent audio Twilio has played, from mark echoes
+    playback = PlaybackTracker()
+    inbound_frames = AUDIO_FRAMES.labels(direction='inbound')
+    outbound_frames = AUDIO_FRAMES.labels(direction='outbound')
+
+    # The call's session is looked up by CallSid once Twilio sends the start event
+    call_sid = None
+    session = None
+    caller_number = 'Unknown'
+    # Handed to tool handlers
+    tool_context = tools.CallContext()
+    call_finished = False
+
+    # Releases the session and spools the transcript once, however the call ends
+    async def finish_call():
+        nonlocal call_finished
+        if call_finished or session is None:
+            return
+        call_finished = True
+        await session_store.release(call_sid)
+        await send_transcript_to_webhook(session)
 
     async def send_first_message(openai_ws):
         nonlocal queued_first_message, openai_ws_ready
         if queued_first_message and openai_ws_ready:
-            print('Sending queued first message:', queued_first_message)
-            await openai_ws.send(json.dumps(queued_first_message))
-            await openai_ws.send(json.dumps({"type": "response.create"}))
+            logger.debug('Sending queued first message: %s', queued_first_message)
+            await openai_ws.send(codec.dumps(queued_first_message))
+            await openai_ws.send(codec.dumps({"type": "response.create"}))
             queued_first_message = None
 
+    async def queue_first_message(openai_ws, call_sid):
+        nonlocal first_message, queued_first_message
+        # A session attached from another worker may already carry the result
+        if session is not None and session.first_message:
+            first_message = session.first_message
+        else:
+            first_message = await first_message_fetcher.wait(call_sid)
+        logger.info('First message: %s', first_message)
+        if session is not None:
+            session.first_message = first_message
+
+        queued_first_message = {
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": "user",
+                "content": [{"type": "input_text", "text": first_message}]
+            }
+        }
+
+        if openai_ws_ready:
+            await send_first_message(openai_ws)
+
     async def handle_twilio(openai_ws):
-        nonlocal first_message, stream_sid, queued_first_message, openai_ws_ready, session_id, session, caller_number
+        nonlocal stream_sid, call_sid, session, caller_number, started_at
+        greeting_task = None
         try:
             while True:
                 message = await websocket.receive_text()
-                data = json.loads(message)
+                # With the standard library parser, media frames are relayed
+                # without parsing the whole event
+                if codec.PEEK_TWILIO_MEDIA and codec.peek_twilio_event(message) == 'media':
+                    payload = codec.extract_string(message, 'payload')
+                    if payload is not None:
+                        await inbound_audio.put(payload)
+                        inbound_frames.inc()
+                        continue
+
+                data = codec.loads(message)
                 if data.get('event') == 'start':
+                    started_at = time.monotonic()
                     stream_sid = data['start']['streamSid']
                     call_sid = data['start']['callSid']
                     custom_parameters = data['start'].get('customParameters', {})
-
-                    print('CallSid:', call_sid)
-                    print('StreamSid:', stream_sid)
-                    print('Custom Parameters:', custom_parameters)
-
-                    caller_number = custom_parameters.get('callerNumber', 'Unknown')
-                    session['callerNumber'] = caller_number
-                    first_message = custom_parameters.get('firstMessage', "Hello, how can I assist you?")
-                    print('First Message:', first_message)
-                    print('Caller Number:', caller_number)
-
-                    queued_first_message = {
-                        "type": "conversation.item.create",
-                        "item": {
-                            "type": "message",
-                            "role": "user",
-                            "content": [{"type": "input_text", "text": first_message}]
-                        }
-                    }
-
-                    if openai_ws_ready:
-                        await send_first_message(openai_ws)
+                    call_fields['call_sid'] = call_sid
+                    call_fields['stream_sid'] = stream_sid
+                    relay.active[call_sid] = (inbound_audio, outbound_audio)
+                    logger.debug('Custom parameters: %s', custom_parameters)
+
+                    session = await session_store.attach(call_sid, stream_sid, custom_parameters.get('callerNumber', 'Unknown'))
+                    caller_number = session.caller_number
+                    tool_context.call_sid = call_sid
+                    tool_context.caller_number = caller_number
+                    tool_context.session = session
+                    call_lifecycle.started(call_sid, finish_call)
+                    logger.info('Media stream started for caller %s', caller_number)
+
+                    # The session may have waited in the pool; refresh the time
+                    # and add this call's caller and persona before the greeting
+                    await openai_ws.send(session_config.call_update(custom_parameters.get('persona'), caller_number))
+
+                    # Wait for the lookup started at /incoming-call without holding up the audio relay
+                    greeting_task = asyncio.create_task(queue_first_message(openai_ws, call_sid))
 
                 elif data.get('event') == 'media':
-                    if openai_ws and openai_ws.open:
-                        audio_append = {
-                            "type": "input_audio_buffer.append",
-                            "audio": data['media']['payload']
-                        }
-                        await openai_ws.send(json.dumps(audio_append))
+                    await inbound_audio.put(data['media']['payload'])
+                    inbound_frames.inc()
+
+                elif data.get('event') == 'mark':
+                    playback.acknowledged(data['mark']['name'])
 
         except WebSocketDisconnect:
-            print(f"Twilio WebSocket disconnected ({session_id}).")
+            logger.info('Twilio WebSocket disconnected')
             if openai_ws.open:
                 await openai_ws.close()
-            sessions.pop(session_id, None)
-            await send_transcript_to_webhook(session)
+            await finish_call()
         except Exception as e:
-            print(f"Error in handle_twilio: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Error in handle_twilio: %s', e)
+        finally:
+            if greeting_task and not greeting_task.done():
+                greeting_task.cancel()
 
     async def handle_openai(openai_ws):
-        nonlocal openai_ws_ready, thread_id, stream_sid, session_id, session, websocket
+        nonlocal openai_ws_ready, thread_id, stream_sid, websocket, greeted
+        # Time the caller stopped speaking, and the agent's reply latency for the transcript
+        speech_stopped_at = None
+        awaiting_reply = False
+        turn_latency_ms = None
         try:
             async for data in openai_ws:
-                response = json.loads(data)
+                # Audio deltas are relayed without parsing the whole event
+                event_type = codec.peek_openai_type(data)
+                delta = codec.extract_string(data, 'delta') if event_type == 'response.audio.delta' else None
+                if delta is not None:
+                    response = None
+                    item_id = codec.extract_string(data, 'item_id')
+                else:
+                    response = codec.loads(data)
+                    event_type = response.get('type')
+                    delta = response.get('delta')
+                    item_id = response.get('item_id')
                 # Handle OpenAI messages
 
                 # Handle audio responses from OpenAI
-                if response.get('type') == 'response.audio.delta' and response.get('delta'):
-                    await websocket.send_text(json.dumps({
-                        "event": "media",
-                        "streamSid": stream_sid,
-                        "media": {"payload": response['delta']}
-                    }))
-
-                # Handle function calls
+                if event_type == 'response.audio.delta':
+                    # Audio still arriving for a reply the caller interrupted
+                    if not delta or item_id in playback.truncated:
+                        continue
+                    if not greeted:
+                        greeted = True
+                        realtime_pool.record_first_greeting(time.monotonic() - connected_at)
+                        if started_at is not None:
+                            TIME_TO_FIRST_AUDIO.observe(time.monotonic() - started_at)
+                    if awaiting_reply:
+                        awaiting_reply = False
+                        reply_latency = time.monotonic() - speech_stopped_at
+                        turn_latency_ms = round(reply_latency * 1000)
+                        RESPONSE_LATENCY.observe(reply_latency)
+                    playback.received(item_id)
+                    await outbound_audio.put(delta, item_id)
+                    outbound_frames.inc()
+
+                # Run function calls as tasks so audio and events keep flowing
                 elif response.get('type') == 'response.function_call_arguments.done':
-                    function_name = response.get('name')
-                    args = json.loads(response.get('arguments', '{}'))
-                    if function_name == 'question_and_answer':
-                        question = args.get('question')
-    
-                        try:
-                            # Initialize Pinecone Assistant via SDK
-                            pc = Pinecone(api_key=PINECONE_API_KEY)
-                            assistant = pc.assistant.Assistant(assistant_name="rag-tool")
-                            
-                            # Create a message object with the user's question
-                            msg = Message(content=question)
-    
-                            # Stream response chunks from Pinecone Assistant
-                            chunks = assistant.chat(messages=[msg], stream=True)
-    
-                            # Accumulate the streamed content to form the complete answer
-                            answer_message = ""
-                            for chunk in chunks:
-                                if chunk and chunk.type == "content_chunk":
-                                    # Append content chunk to the answer message
-                                    answer_message += chunk.delta.content
-    
-                            # Send the streamed response as OpenAI response
-                            function_output_event = {
-                                "type": "conversation.item.create",
-                                "item": {
-                                    "type": "function_call_output",
-                                    "role": "system",
-                                    "output": answer_message
-                                }
-                            }
-    
-                            # Send the function call output (answer from Pinecone)
-                            await openai_ws.send(json.dumps(function_output_event))
-    
-                            # Send the response to OpenAI to create a reply
-                            await openai_ws.send(json.dumps({
-                                "type": "response.create",
-                                "response": {
-                                    "modalities": ["text", "audio"],
-                                    "instructions": f"Respond to the user's question \"{question}\" based on this information: {answer_message}. Be concise and friendly."
-                                }
-                            }))
-    
-                        except Exception as e:
-                            print('Error processing question via Pinecone Assistant:', e)
-                            await send_error_response(openai_ws)
-                    elif function_name == 'schedule_meeting':
-                        name = args.get('name')
-                        email = args.get('email')
-                        purpose = args.get('purpose')
-                        datetime_param = args.get('datetime')
-                        location = args.get('location')  # The user's selected location
-
-                        # Calendar IDs for each location
-                        calendars = {
-                            "LOCATION1": "CALENDAR_EMAIL1",
-                            "LOCATION2": "CALENDAR_EMAIL2",
-                            "LOCATION3": "CALENDAR_EMAIL3",
-                            # Add more locations as needed
-                        }
-
-                        try:
-                            # Select the correct calendar based on location
-                            calendar_id = calendars.get(location)
-                            if not calendar_id:
-                                raise ValueError(f"Invalid location: {location}")
-                            data = json.dumps({
-                                "name": name,
-                                "email": email,
-                                "purpose": purpose,
-                                "datetime": datetime_param,
-                                "calendar_id": calendar_id  
-                            })
-
-                            webhook_response = await send_to_webhook({
-                                "route": "3",
-                                "number": session.get('callerNumber', 'Unknown'),
-                                "data": data
-                            })
-                            parsed_response = json.loads(webhook_response)
-                            booking_message = parsed_response.get('message', "I'm sorry, I couldn't schedule the meeting at this time.")
-                            
-                            function_output_event = {
-                                "type": "conversation.item.create",
-                                "item": {
-                                    "type": "function_call_output",
-                                    "role": "system",
-                                    "output": booking_message
-                                }
-                            }
-                            await openai_ws.send(json.dumps(function_output_event))
-                            await openai_ws.send(json.dumps({
-                                "type": "response.create",
-                                "response": {
-                                    "modalities": ["text", "audio"],
-                                    "instructions": booking_message
-                                }
-                            }))
-                        except Exception as e:
-                            print('Error Schedule Meeting:', e)
-                            await send_error_response(openai_ws)
+                    tool_runner.start(response.get('name'), response.get('call_id'), response.get('arguments'))
 
                 # Handle user starting to speak
                 elif response.get('type') == 'input_audio_buffer.speech_started':
-                    print("Speech Start:", response.get('type'))
-                    # Clear any ongoing speech on Twilio side
-                    await websocket.send_text(json.dumps({
+                    logger.debug('Speech started')
+                    # Drop agent audio not yet sent to Twilio, then clear what Twilio has buffered
+                    dropped = outbound_audio.clear()
+                    await filler.stop()
+                    interrupted = playback.interrupt()
+                    await websocket.send_text(codec.dumps({
                         "streamSid": stream_sid,
                         "event": "clear"
                     }))
-                    print("Cancelling AI speech from the server")
+                    logger.debug('Cancelling AI speech from the server')
                     # Send interrupt message to OpenAI to cancel ongoing response
                     interrupt_message = {
                         "type": "response.cancel"
                     }
-                    await openai_ws.send(json.dumps(interrupt_message))
+                    await openai_ws.send(codec.dumps(interrupt_message))
+                    # Tell the model how much of its reply the caller actually heard
+                    if interrupted:
+                        item_id, audio_end_ms = interrupted
+                        await openai_ws.send(codec.dumps({
+                            "type": "conversation.item.truncate",
+                            "item_id": item_id,
+                            "content_index": 0,
+                            "audio_end_ms": audio_end_ms
+                        }))
+                        logger.info('Barge-in: truncated %s at %d ms, dropped %d queued chunks', item_id, audio_end_ms, dropped)
+                    # Drop any answer still being fetched for the interrupted turn
+                    if tool_runner.barge_in():
+                        logger.debug('Cancelled pending tool calls on barge-in')
 
                 # Log agent response
                 elif response.get('type') == 'response.done':
+                    playback.response_done()
                     response_output = response.get('response', {}).get('output', [])
                     if response_output and isinstance(response_output, list) and len(response_output) > 0:
                         output_item = response_output[0]
@@ -398,67 +447,78 @@ async def media_stream(websocket: WebSocket):
                             agent_message = 'Agent message not found'
                     else:
                         agent_message = 'Agent message not found'
-                    session['transcript'] += f"Agent: {agent_message}\n"
-                    print(f"Agent ({session_id}): {agent_message}")
+                    if session is not None:
+                        session.transcript.add("Agent", agent_message, turn_latency_ms)
+                        session_store.touch(session)
+                    turn_latency_ms = None
+                    logger.info('Agent: %s', agent_message)
 
                 # Log user transcription
                 elif response.get('type') == 'conversation.item.input_audio_transcription.completed' and response.get('transcript'):
                     user_message = response['transcript'].strip()
-                    session['transcript'] += f"User: {user_message}\n"
-                    print(f"User ({session_id}): {user_message}")
+                    if session is not None:
+                        transcription_ms = round((time.monotonic() - speech_stopped_at) * 1000) if speech_stopped_at else None
+                        session.transcript.add("User", user_message, transcription_ms)
+                        session_store.touch(session)
+                    logger.info('User: %s', user_message)
+
+                # Start timing the agent's reply once the caller stops speaking
+                elif response.get('type') == 'input_audio_buffer.speech_stopped':
+                    speech_stopped_at = time.monotonic()
+                    awaiting_reply = True
+                    event_logger.debug('Received event: %s %s', response.get('type'), response)
 
                 # Log other relevant events
                 elif response.get('type') in LOG_EVENT_TYPES:
-                    print(f"Received event: {response.get('type')}", response)
+                    event_logger.debug('Received event: %s %s', response.get('type'), response, extra=logs.SAMPLED)
 
         except Exception as e:
-            print(f"Error in handle_openai: {e}")
-            import traceback
-            traceback.print_exc()
-
-    async def send_error_response(openai_ws):
-        await openai_ws.send(json.dumps({
-            "type": "response.create",
-            "response": {
-                "modalities": ["text", "audio"],
-                "instructions": "I apologize, but I'm having trouble processing your request right now. Is there anything else I can help you with?"
-            }
-        }))
+            logger.exception('Error in handle_openai: %s', e)
+        finally:
+            tool_runner.cancel_all()
 
     async def send_transcript_to_webhook(session):
-        print('Full Transcript:')
-        print(session['transcript'])
-        print('Final Caller Number:', session.get('callerNumber', 'Unknown'))
-        await send_to_webhook({
-            "route": "2",
-            "number": session.get('callerNumber', 'Unknown'),
-            "data": session['transcript']
-        })
-
-    async def send_to_webhook(payload):
-        print('Sending data to webhook:', json.dumps(payload, indent=2))
+        transcript_text = session.transcript.render()
+        logger.debug('Full transcript for %s:\n%s', session.caller_number, transcript_text)
+        # Spooled to disk and uploaded in the background, with retries
         try:
-            response = requests.post(
-                N8N_WEBHOOK_URL,
-                headers={"Content-Type": "application/json"},
-                json=payload
-            )
-            print('Webhook response status:', response.status_code)
-            if response.ok:
-                response_text = response.text
-                print('Webhook response:', response_text)
-                return response_text
-            else:
-                print(f"Failed to send data to webhook: {response.status_code}")
-                raise Exception('Webhook request failed')
-        except Exception as e:
-            print('Error sending data to webhook:', e)
-            raise e
+            await delivery_queue.enqueue({
+                "route": "2",
+                "number": session.caller_number,
+                "data": transcript_text
+            }, f"{session.call_sid}:transcript")
+        finally:
+            await session.transcript.close()
 
     try:
-        async with websockets.connect(openai_ws_url, extra_headers=openai_ws_headers) as openai_ws:
+        # Take a pre-configured OpenAI Realtime session, or connect a new one
+        acquire_started = time.monotonic()
+        openai_ws, pooled = await realtime_pool.acquire()
+        OPENAI_CONNECT.labels(pooled=str(pooled).lower()).observe(time.monotonic() - acquire_started)
+        logger.info('OpenAI Realtime session ready in %.3fs (pooled: %s)', time.monotonic() - connected_at, pooled)
+
+        # Audio goes through bounded queues so a lagging socket never stalls the other reader
+        async def send_to_openai(payload, _tag):
+            if openai_ws.open:
+                await openai_ws.send(codec.openai_audio_append(payload))
+
+        # Each chunk is followed by a mark so Twilio reports when it has been played
+        async def send_to_twilio(payload, item_id):
+            if item_id in playback.truncated:
+                return
+            await websocket.send_text(codec.twilio_media(stream_sid, payload))
+            mark = playback.sent(item_id, audio_ms(payload))
+            await websocket.send_text(codec.dumps({"event": "mark", "streamSid": stream_sid, "mark": {"name": mark}}))
+
+        inbound_audio = relay.inbound_queue(send_to_openai)
+        outbound_audio = relay.outbound_queue(send_to_twilio)
+        relay_tasks = [asyncio.create_task(inbound_audio.run()), asyncio.create_task(outbound_audio.run())]
+        # Covers the silence while slow tools run, without talking over the agent
+        filler = FillerPlayer(websocket.send_text, lambda: stream_sid,
+                              lambda: playback.playing or outbound_audio.depth > 0, filler_library)
+        tool_runner = tools.ToolRunner(openai_ws, tool_context, filler)
+        try:
             openai_ws_ready = True
-            await send_session_update(openai_ws)
             await send_first_message(openai_ws)
 
             # Start the tasks
@@ -467,14 +527,29 @@ async def media_stream(websocket: WebSocket):
 
             # Wait for both tasks to complete
             await asyncio.gather(twilio_task, openai_task)
+        finally:
+            for task in relay_tasks:
+                task.cancel()
+            relay.active.pop(call_sid, None)
+            logger.info('Relay inbound %s, outbound %s, playback %s, filler %s',
+                        inbound_audio.stats(), outbound_audio.stats(), playback.stats(), filler.stats())
+            # Calls that ended without a clean disconnect still hand off their transcript
+            try:
+                await finish_call()
+            finally:
+                call_lifecycle.ended(call_sid)
+                await openai_ws.close()
 
     except Exception as e:
-        print(f"Error in media_stream: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in media_stream: %s', e)
 
 
-# Start the FastAPI server using Uvicorn
+# Start the FastAPI server using Uvicorn; SIGTERM drains calls before exiting
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    if WORKERS > 1:
+        if not session_store.backend.shared:
+            logger.warning('Several workers need a shared SESSION_BACKEND (sqlite:/// or redis://)')
+        lifecycle.run(uvicorn.Config("main:app", host="0.0.0.0", port=PORT, workers=WORKERS))
+    else:
+        lifecycle.run(uvicorn.Config(app, host="0.0.0.0", port=PORT))
@@ -0,0 +1,177 @@
+# Prometheus-style metrics for the call hot path, served on /metrics.
+#
+# A minimal in-process implementation of counters, gauges and histograms with
+# labels, rendered in the Prometheus text exposition format. Hot paths should
+# bind label values once with .labels(...) and keep the child around, so each
+# update is a plain attribute increment.
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-frame relay work up to slow webhooks
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+
+# Metric name -> metric. Registering a name again replaces the earlier metric:
+# a spawned worker runs main.py twice, as __mp_main__ and then as the main
+# module uvicorn serves, and only the second copy's gauges read live objects.
+REGISTRY = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        REGISTRY[name] = self
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(child.samples(self.name, list(zip(self.labelnames, key, strict=True))))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    # With a function, the value is read when /metrics is scraped
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def render(self):
+        if self.function is not None:
+            try:
+                self.labels().set(self.function())
+            except Exception as e:
+                logger.error('Error reading gauge %s: %s', self.name, e)
+        return super().render()
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts, strict=True):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+def render():
+    lines = []
+    for metric in list(REGISTRY.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared across modules
+WEBHOOK_LATENCY = Histogram('n8n_webhook_seconds', 'N8N webhook round trip by route, including queueing', ['route'])
+WEBHOOK_ERRORS = Counter('n8n_webhook_errors_total', 'N8N webhook requests that failed or timed out', ['route'])
+OPENAI_CONNECT = Histogram('openai_realtime_connect_seconds', 'Time to obtain a configured OpenAI Realtime session', ['pooled'])
+TIME_TO_FIRST_AUDIO = Histogram('call_time_to_first_audio_seconds', 'Twilio start event to first agent audio frame')
+RESPONSE_LATENCY = Histogram('call_response_latency_seconds', 'input_audio_buffer.speech_stopped to first response.audio.delta')
+TOOL_DURATION = Histogram('tool_call_seconds', 'Function call duration by tool', ['tool'])
+FIRST_MESSAGE_WAIT = Histogram('first_message_wait_seconds', 'Time the media stream waited for the first message lookup')
+FIRST_MESSAGE_SAVED = Histogram('first_message_saved_seconds', 'First message lookup time overlapped with stream setup')
+AUDIO_FRAMES = Counter('audio_frames_total', 'Audio frames relayed', ['direction'])
+PROCESS_CPU = Gauge('process_cpu_seconds_total', 'CPU time used by this worker process, all threads', function=time.process_time)
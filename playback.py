@@ -0,0 +1,148 @@
+# Tracks how much agent audio Twilio has actually played.
+#
+# Every outbound media message is followed by a Twilio mark; Twilio echoes the
+# mark back once the audio before it has been played (or cleared). The audio
+# of acknowledged marks has been heard in full, and the chunk after the last
+# acknowledged mark has been playing since that acknowledgement. On barge-in
+# this gives the millisecond the caller stopped hearing the reply, which is
+# sent to OpenAI as conversation.item.truncate so the model knows what the
+# caller did not hear.
+import time
+from collections import deque
+
+from metrics import Counter, Histogram
+
+# g711 u-law at 8 kHz: one byte per sample
+BYTES_PER_MS = 8
+
+INTERRUPTS = Counter('call_interrupts_total', 'Barge-ins that cut off agent audio')
+INTERRUPT_LATENCY = Histogram('call_interrupt_to_silence_seconds',
+                              'speech_started to Twilio confirming its audio buffer was cleared',
+                              buckets=(0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0))
+
+
+def audio_ms(payload):
+    # Duration of a base64 u-law payload without decoding it
+    padding = 2 if payload.endswith('==') else 1 if payload.endswith('=') else 0
+    return (len(payload) * 3 // 4 - padding) / BYTES_PER_MS
+
+
+class _Mark:
+    __slots__ = ('name', 'item_id', 'ms', 'sent_at')
+
+    def __init__(self, name, item_id, ms, sent_at):
+        self.name = name
+        self.item_id = item_id
+        self.ms = ms
+        self.sent_at = sent_at
+
+
+class PlaybackTracker:
+    def __init__(self):
+        self._marks = deque()
+        self._sequence = 0
+        self._played = {}
+        self._last_ack_at = None
+        # Items cut off by barge-in; late deltas for them are not played
+        self.truncated = set()
+        # Reply whose audio is still arriving, marked or not
+        self._receiving = None
+        # Set on barge-in until Twilio confirms the clear
+        self._interrupted_at = None
+        self.interrupts = 0
+        self.silenced = 0
+        self.truncated_ms_total = 0.0
+        self.sent_ms_total = 0.0
+        self.played_ms_total = 0.0
+        self.interrupt_latency_total = 0.0
+        self.interrupt_latency_max = 0.0
+
+    @property
+    def playing(self):
+        return bool(self._marks)
+
+    def received(self, item_id):
+        self._receiving = item_id
+
+    def response_done(self):
+        self._receiving = None
+
+    def sent(self, item_id, ms):
+        # Returns the name of the mark to send after this audio
+        self._sequence += 1
+        name = str(self._sequence)
+        now = time.monotonic()
+        if not self._marks:
+            # Twilio's buffer was empty, so this audio starts playing now
+            self._last_ack_at = now
+        self._marks.append(_Mark(name, item_id, ms, now))
+        self.sent_ms_total += ms
+        return name
+
+    def acknowledged(self, name):
+        now = time.monotonic()
+        if self._interrupted_at is not None:
+            # The first echo after a clear confirms the caller hears silence
+            latency = now - self._interrupted_at
+            self._interrupted_at = None
+            self.silenced += 1
+            self.interrupt_latency_total += latency
+            self.interrupt_latency_max = max(self.interrupt_latency_max, latency)
+            INTERRUPT_LATENCY.observe(latency)
+        marks = self._marks
+        if not any(mark.name == name for mark in marks):
+            return
+        while marks:
+            mark = marks.popleft()
+            self._played[mark.item_id] = self._played.get(mark.item_id, 0.0) + mark.ms
+            self.played_ms_total += mark.ms
+            if mark.name == name:
+                break
+        self._last_ack_at = now
+
+    def played_ms(self, item_id):
+        played = self._played.get(item_id, 0.0)
+        if self._marks and self._marks[0].item_id == item_id:
+            current = self._marks[0]
+            started = max(self._last_ack_at or current.sent_at, current.sent_at)
+            played += min(max(0.0, (time.monotonic() - started) * 1000), current.ms)
+        return played
+
+    def interrupt(self):
+        # Returns (item_id, audio_end_ms) for the reply being played, or None
+        if not self._marks:
+            # Nothing of the reply is in Twilio's buffer yet, or all of it has
+            # been heard so far; deltas still in flight must not be played
+            item_id = self._receiving
+            if item_id is None or item_id in self.truncated:
+                return None
+            self._receiving = None
+            self.truncated.add(item_id)
+            self.interrupts += 1
+            INTERRUPTS.inc()
+            return item_id, int(self._played.get(item_id, 0.0))
+        item_id = self._marks[0].item_id
+        played = self.played_ms(item_id)
+        unplayed = sum(mark.ms for mark in self._marks) - (played - self._played.get(item_id, 0.0))
+        self._marks.clear()
+        if self._receiving is not None:
+            # A newer reply already streaming in is cut off too
+            self.truncated.add(self._receiving)
+            self._receiving = None
+        self.truncated.add(item_id)
+        self.interrupts += 1
+        self.truncated_ms_total += unplayed
+        self._interrupted_at = time.monotonic()
+        INTERRUPTS.inc()
+        return item_id, int(played)
+
+    def stats(self):
+        return {
+            "interrupts": self.interrupts,
+            "sentMs": round(self.sent_ms_total),
+            "playedMs": round(self.played_ms_total),
+            "truncatedMs": round(self.truncated_ms_total),
+            "pendingMarks": len(self._marks),
+            "avgInterruptToSilenceSeconds": self.interrupt_latency_total / self.silenced if self.silenced else 0.0,
+            "maxInterruptToSilenceSeconds": self.interrupt_latency_max
+        }
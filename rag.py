@@ -0,0 +1,93 @@
+# Pinecone Assistant lookups for the question_and_answer tool.
+#
+# One assistant handle is created lazily and shared by every call. The
+# Pinecone SDK streams answers through a blocking generator, so it is
+# consumed on a worker pool and each chunk is handed back to the event loop
+# through an asyncio queue. Cancelling the consumer (e.g. when the caller
+# barges in) stops the worker at the next chunk.
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pinecone import Pinecone
+from pinecone_plugins.assistant.models.chat import Message
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_ASSISTANT_NAME = os.getenv("PINECONE_ASSISTANT_NAME", "rag-tool")
+RAG_MAX_WORKERS = int(os.getenv('RAG_MAX_WORKERS', 8))
+
+_assistant = None
+_assistant_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix='rag')
+
+# Marks the end of a streamed answer on the chunk queue
+_DONE = object()
+
+
+def get_assistant():
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                pc = Pinecone(api_key=PINECONE_API_KEY)
+                _assistant = pc.assistant.Assistant(assistant_name=PINECONE_ASSISTANT_NAME)
+    return _assistant
+
+
+# Replace the shared assistant, e.g. with a local stand-in for benchmarks
+def set_assistant(assistant):
+    global _assistant
+    with _assistant_lock:
+        _assistant = assistant
+
+
+async def stream_answer(question):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop has already shut down
+            stopped.set()
+
+    def produce():
+        try:
+            chunks = get_assistant().chat(messages=[Message(content=question)], stream=True)
+            try:
+                for chunk in chunks:
+                    if stopped.is_set():
+                        break
+                    if chunk and chunk.type == "content_chunk":
+                        put(chunk.delta.content)
+            finally:
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    loop.run_in_executor(_executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+async def answer_question(question):
+    return "".join([content async for content in stream_answer(question)])
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,204 @@
+# Pool of pre-connected, pre-configured OpenAI Realtime sessions.
+#
+# Opening the Realtime WebSocket and applying the session.update costs a TLS
+# handshake plus a round trip before the caller can hear anything. The pool
+# keeps a few sessions ready so media_stream can take one instantly. The
+# number of idle sessions follows the recent call arrival rate, idle sessions
+# are health checked, and sessions past REALTIME_POOL_MAX_AGE are replaced
+# before the Realtime API would expire them mid-call.
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+REALTIME_POOL_MIN_SIZE = int(os.getenv('REALTIME_POOL_MIN_SIZE', 1))
+REALTIME_POOL_MAX_SIZE = int(os.getenv('REALTIME_POOL_MAX_SIZE', 8))
+REALTIME_POOL_MAX_AGE = float(os.getenv('REALTIME_POOL_MAX_AGE', 300))
+REALTIME_CONNECT_TIMEOUT = float(os.getenv('REALTIME_CONNECT_TIMEOUT', 10))
+# Window (seconds) over which the call arrival rate is measured
+ARRIVAL_WINDOW = 60
+# How often idle sessions are checked and the pool is resized
+MAINTENANCE_INTERVAL = 5
+HEALTH_CHECK_INTERVAL = 30
+PING_TIMEOUT = 5
+
+
+class _PooledSession:
+    __slots__ = ('ws', 'created_at', 'checked_at')
+
+    def __init__(self, ws, created_at):
+        self.ws = ws
+        self.created_at = created_at
+        self.checked_at = created_at
+
+
+class RealtimePool:
+    def __init__(self, url, headers, build_session_update, min_size=REALTIME_POOL_MIN_SIZE,
+                 max_size=REALTIME_POOL_MAX_SIZE, max_age=REALTIME_POOL_MAX_AGE):
+        self.url = url
+        self.headers = headers
+        self.build_session_update = build_session_update
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.max_age = max_age
+        self._idle = deque()
+        self._arrivals = deque()
+        self._connecting = 0
+        self._setup_time = 1.0  # Moving average of connect + configure time
+        self._wakeup = asyncio.Event()
+        self._maintainer = None
+        self._fills = set()
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0
+        self.failures = 0
+        self.greetings = 0
+        self.greeting_time_total = 0.0
+        self.greeting_time_max = 0.0
+
+    async def start(self):
+        if self.max_size > 0 and self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        if self._maintainer:
+            self._maintainer.cancel()
+            self._maintainer = None
+        for fill in list(self._fills):
+            fill.cancel()
+        while self._idle:
+            await self._idle.popleft().ws.close()
+
+    # Take a ready session, or open one directly if none is available.
+    # Returns the socket and whether it came from the pool.
+    async def acquire(self):
+        now = time.monotonic()
+        self._arrivals.append(now)
+        while self._idle:
+            pooled = self._idle.popleft()
+            if self._usable(pooled, now):
+                self.hits += 1
+                self._wakeup.set()
+                return pooled.ws, True
+            self.replaced += 1
+            asyncio.create_task(pooled.ws.close())
+        self.misses += 1
+        self._wakeup.set()
+        return await self._open(), False
+
+    def record_first_greeting(self, seconds):
+        self.greetings += 1
+        self.greeting_time_total += seconds
+        self.greeting_time_max = max(self.greeting_time_max, seconds)
+
+    def target_size(self):
+        now = time.monotonic()
+        while self._arrivals and self._arrivals[0] < now - ARRIVAL_WINDOW:
+            self._arrivals.popleft()
+        # Sessions consumed while one replacement is being set up, with headroom
+        rate = len(self._arrivals) / ARRIVAL_WINDOW
+        wanted = self.min_size + math.ceil(rate * self._setup_time * 2)
+        return min(self.max_size, wanted)
+
+    def stats(self):
+        acquired = self.hits + self.misses
+        return {
+            "idle": len(self._idle),
+            "connecting": self._connecting,
+            "targetSize": self.target_size(),
+            "maxSize": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / acquired if acquired else 0.0,
+            "replaced": self.replaced,
+            "failures": self.failures,
+            "setupTimeSeconds": self._setup_time,
+            "firstGreetings": self.greetings,
+            "avgTimeToFirstGreetingSeconds": self.greeting_time_total / self.greetings if self.greetings else 0.0,
+            "maxTimeToFirstGreetingSeconds": self.greeting_time_max
+        }
+
+    def _usable(self, pooled, now):
+        return pooled.ws.open and now - pooled.created_at < self.max_age
+
+    async def _open(self):
+        started = time.monotonic()
+        ws = await websockets.connect(self.url, extra_headers=self.headers, open_timeout=REALTIME_CONNECT_TIMEOUT)
+        try:
+            await ws.send(self.build_session_update())
+            await asyncio.wait_for(self._wait_for_session_updated(ws), REALTIME_CONNECT_TIMEOUT)
+        except BaseException:
+            await ws.close()
+            raise
+        self._setup_time = 0.8 * self._setup_time + 0.2 * (time.monotonic() - started)
+        return ws
+
+    async def _wait_for_session_updated(self, ws):
+        async for message in ws:
+            event = json.loads(message)
+            if event.get('type') == 'session.updated':
+                return
+            if event.get('type') == 'error':
+                raise RuntimeError(f"Realtime session setup failed: {event.get('error')}")
+        raise ConnectionError("Realtime socket closed during session setup")
+
+    async def _fill_one(self):
+        self._connecting += 1
+        try:
+            ws = await self._open()
+            self._idle.append(_PooledSession(ws, time.monotonic()))
+        except Exception as e:
+            self.failures += 1
+            logger.error('Error pre-connecting OpenAI Realtime session: %s', e)
+        finally:
+            self._connecting -= 1
+
+    async def _check(self, pooled):
+        try:
+            pong = await pooled.ws.ping()
+            await asyncio.wait_for(pong, PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def _maintain(self):
+        while True:
+            # Cleared before the pass, so a wakeup set while it runs starts another
+            self._wakeup.clear()
+            try:
+                # Replace expired or unhealthy idle sessions
+                now = time.monotonic()
+                due = [pooled for pooled in self._idle if now - pooled.checked_at >= HEALTH_CHECK_INTERVAL]
+                checked = await asyncio.gather(*(self._check(pooled) for pooled in due))
+                for pooled, ok in zip(due, checked, strict=True):
+                    pooled.checked_at = now
+                    if not ok and pooled in self._idle:
+                        self._idle.remove(pooled)
+                        self.replaced += 1
+                        asyncio.create_task(pooled.ws.close())
+                for pooled in [pooled for pooled in self._idle if not self._usable(pooled, now)]:
+                    self._idle.remove(pooled)
+                    self.replaced += 1
+                    asyncio.create_task(pooled.ws.close())
+
+                target = self.target_size()
+                while len(self._idle) > target:
+                    await self._idle.popleft().ws.close()
+                missing = target - len(self._idle) - self._connecting
+                for _ in range(max(0, missing)):
+                    fill = asyncio.create_task(self._fill_one())
+                    self._fills.add(fill)
+                    fill.add_done_callback(self._fills.discard)
+            except Exception as e:
+                logger.exception('Error maintaining OpenAI Realtime pool: %s', e)
+
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), MAINTENANCE_INTERVAL)
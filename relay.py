@@ -0,0 +1,160 @@
+# Bounded audio queues between the Twilio and OpenAI sockets.
+#
+# The socket readers put audio payloads on a per-direction queue and return
+# straight away; a sender task per direction drains it to the other socket.
+# When a peer lags, the queue absorbs the burst up to its bound and then
+# applies its policy:
+#   drop_oldest - discard the oldest queued payload (stale caller audio)
+#   drop_newest - discard the payload being added
+#   block       - make the reader wait, pushing back on the source socket
+# Payloads that are queued up together are coalesced into one message of at
+# most `coalesce` payloads, which cuts per-frame send overhead while the
+# sender is catching up and adds no delay when it is not. Payloads carry an
+# optional tag (the OpenAI item id for agent audio); only payloads with the
+# same tag are merged, and send is called as send(payload, tag).
+import asyncio
+import base64
+import logging
+import os
+from collections import deque
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+RELAY_INBOUND_MAX_FRAMES = int(os.getenv('RELAY_INBOUND_MAX_FRAMES', 50))      # 1 s of 20 ms Twilio frames
+RELAY_INBOUND_POLICY = os.getenv('RELAY_INBOUND_POLICY', 'drop_oldest')
+RELAY_INBOUND_COALESCE = int(os.getenv('RELAY_INBOUND_COALESCE', 10))
+RELAY_OUTBOUND_MAX_FRAMES = int(os.getenv('RELAY_OUTBOUND_MAX_FRAMES', 500))
+RELAY_OUTBOUND_POLICY = os.getenv('RELAY_OUTBOUND_POLICY', 'block')
+RELAY_OUTBOUND_COALESCE = int(os.getenv('RELAY_OUTBOUND_COALESCE', 4))
+
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+RELAY_DROPPED = Counter('relay_dropped_frames_total', 'Audio payloads dropped by a full relay queue', ['direction'])
+RELAY_COALESCED = Counter('relay_coalesced_frames_total', 'Audio payloads merged into a larger message', ['direction'])
+
+# Relay queues of the calls on this worker, by CallSid
+active = {}
+
+
+def merge_payloads(payloads):
+    # Base64 chunks cannot simply be concatenated (each may end in padding)
+    if len(payloads) == 1:
+        return payloads[0]
+    return base64.b64encode(b''.join(base64.b64decode(payload) for payload in payloads)).decode('ascii')
+
+
+class AudioQueue:
+    def __init__(self, direction, send, max_frames, policy, coalesce):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown relay policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.direction = direction
+        self.max_frames = max_frames
+        self.policy = policy
+        self.coalesce = max(1, coalesce)
+        self._send = send
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._dropped = RELAY_DROPPED.labels(direction=direction)
+        self._coalesced = RELAY_COALESCED.labels(direction=direction)
+        self.queued = 0
+        self.sent = 0
+        self.messages = 0
+        self.dropped = 0
+        self.cleared = 0
+        self.max_depth = 0
+        # Set once the peer socket fails; later payloads are discarded
+        self.closed = False
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    async def put(self, payload, tag=None):
+        if self.closed:
+            return
+        if len(self._frames) >= self.max_frames:
+            if self.policy == 'drop_newest':
+                self._drop(1)
+                return
+            if self.policy == 'drop_oldest':
+                self._frames.popleft()
+                self._drop(1)
+            else:
+                while len(self._frames) >= self.max_frames and not self.closed:
+                    self._space.clear()
+                    await self._space.wait()
+                if self.closed:
+                    return
+        self._frames.append((payload, tag))
+        self.queued += 1
+        if len(self._frames) > self.max_depth:
+            self.max_depth = len(self._frames)
+        self._ready.set()
+
+    def clear(self):
+        # Drop everything not yet sent; returns the number of payloads dropped
+        dropped = len(self._frames)
+        self._frames.clear()
+        self.cleared += dropped
+        self._space.set()
+        return dropped
+
+    async def run(self):
+        frames = self._frames
+        while True:
+            if not frames:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            payload, tag = frames.popleft()
+            payloads = [payload]
+            while frames and len(payloads) < self.coalesce and frames[0][1] == tag:
+                payloads.append(frames.popleft()[0])
+            count = len(payloads)
+            self._space.set()
+            if count > 1:
+                self._coalesced.inc(count)
+            try:
+                await self._send(merge_payloads(payloads), tag)
+            except Exception as e:
+                # The peer went away; release any reader blocked on a full queue
+                logger.debug('Stopping %s relay: %s', self.direction, e)
+                self.closed = True
+                self._frames.clear()
+                self._space.set()
+                return
+            self.sent += count
+            self.messages += 1
+
+    def _drop(self, count):
+        self.dropped += count
+        self._dropped.inc(count)
+
+    def stats(self):
+        return {
+            "depth": len(self._frames),
+            "maxDepth": self.max_depth,
+            "maxFrames": self.max_frames,
+            "policy": self.policy,
+            "queued": self.queued,
+            "sent": self.sent,
+            "messages": self.messages,
+            "dropped": self.dropped,
+            "cleared": self.cleared
+        }
+
+
+def inbound_queue(send):
+    return AudioQueue('inbound', send, RELAY_INBOUND_MAX_FRAMES, RELAY_INBOUND_POLICY, RELAY_INBOUND_COALESCE)
+
+
+def outbound_queue(send):
+    return AudioQueue('outbound', send, RELAY_OUTBOUND_MAX_FRAMES, RELAY_OUTBOUND_POLICY, RELAY_OUTBOUND_COALESCE)
+
+
+def stats():
+    return {call_sid: {queue.direction: queue.stats() for queue in queues} for call_sid, queues in list(active.items())}
@@ -0,0 +1,279 @@
+# Backends that hand call records from /incoming-call to /media-stream.
+#
+# With several uvicorn workers or nodes, Twilio's webhook and its media
+# stream can land on different processes. /incoming-call publishes a small
+# JSON record for the CallSid (caller number, call details, first message)
+# and whichever process receives the media stream reads it back.
+#
+# SESSION_BACKEND selects the implementation:
+#   memory                  - this process only (default, single worker)
+#   sqlite:///path/to.db    - processes on one machine
+#   redis://host:6379/0     - processes on several machines
+import abc
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
+
+import codec
+from sqlite_db import SQLiteDatabase
+
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+REDIS_KEY_PREFIX = os.getenv('REDIS_KEY_PREFIX', 'voice-agent:session:')
+
+
+class SessionBackend(abc.ABC):
+    # Whether other processes can see the records
+    shared = False
+
+    @abc.abstractmethod
+    async def get(self, call_sid):
+        ...
+
+    @abc.abstractmethod
+    async def put(self, call_sid, record, ttl):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, call_sid):
+        ...
+
+    @abc.abstractmethod
+    async def count(self):
+        ...
+
+    # Merges fields into an existing record and keeps its expiry; returns
+    # False, writing nothing, when the record has expired or been deleted
+    @abc.abstractmethod
+    async def update(self, call_sid, fields):
+        ...
+
+    # Optional: backends holding connections or threads release them here
+    async def close(self):
+        return None
+
+
+class MemoryBackend(SessionBackend):
+    def __init__(self):
+        self._records = {}
+
+    async def get(self, call_sid):
+        entry = self._records.get(call_sid)
+        if entry is None:
+            return None
+        record, expires_at = entry
+        if expires_at <= time.time():
+            del self._records[call_sid]
+            return None
+        return dict(record)
+
+    async def put(self, call_sid, record, ttl):
+        self._records[call_sid] = (record, time.time() + ttl)
+        # Amortized cleanup keeps abandoned records from piling up
+        if len(self._records) % 256 == 0:
+            now = time.time()
+            for sid in [sid for sid, (_, expires_at) in self._records.items() if expires_at <= now]:
+                del self._records[sid]
+
+    async def update(self, call_sid, fields):
+        entry = self._records.get(call_sid)
+        if entry is None or entry[1] <= time.time():
+            return False
+        record, expires_at = entry
+        self._records[call_sid] = ({**record, **fields}, expires_at)
+        return True
+
+    async def delete(self, call_sid):
+        self._records.pop(call_sid, None)
+
+    async def count(self):
+        now = time.time()
+        return sum(1 for _, expires_at in self._records.values() if expires_at > now)
+
+
+class SQLiteBackend(SessionBackend):
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._sqlite = SQLiteDatabase(path, [
+            "CREATE TABLE IF NOT EXISTS sessions (call_sid TEXT PRIMARY KEY, record TEXT NOT NULL, expires_at REAL NOT NULL)"
+        ], 'sessions-sqlite')
+        self._connect = self._sqlite.connect
+        self._run = self._sqlite.run
+
+    def _get(self, call_sid):
+        row = self._connect().execute(
+            "SELECT record FROM sessions WHERE call_sid = ? AND expires_at > ?", (call_sid, time.time())
+        ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def _put(self, call_sid, record, ttl):
+        db = self._connect()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO sessions (call_sid, record, expires_at) VALUES (?, ?, ?)",
+            (call_sid, codec.dumps(record), now + ttl)
+        )
+        db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def _update(self, call_sid, fields):
+        db = self._connect()
+        row = db.execute(
+            "SELECT record FROM sessions WHERE call_sid = ? AND expires_at > ?", (call_sid, time.time())
+        ).fetchone()
+        if row is None:
+            return False
+        record = {**codec.loads(row[0]), **fields}
+        db.execute("UPDATE sessions SET record = ? WHERE call_sid = ?", (codec.dumps(record), call_sid))
+        return True
+
+    def _delete(self, call_sid):
+        self._connect().execute("DELETE FROM sessions WHERE call_sid = ?", (call_sid,))
+
+    def _count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+    async def get(self, call_sid):
+        return await self._run(self._get, call_sid)
+
+    async def put(self, call_sid, record, ttl):
+        await self._run(self._put, call_sid, record, ttl)
+
+    async def update(self, call_sid, fields):
+        return await self._run(self._update, call_sid, fields)
+
+    async def delete(self, call_sid):
+        await self._run(self._delete, call_sid)
+
+    async def count(self):
+        return await self._run(self._count)
+
+    async def close(self):
+        await self._sqlite.close()
+
+
+class RedisError(Exception):
+    pass
+
+
+# Minimal async client for the Redis protocol (RESP2), enough for GET/SET/DEL/SCAN
+class RedisBackend(SessionBackend):
+    shared = True
+
+    def __init__(self, url, prefix=REDIS_KEY_PREFIX):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send('AUTH', self.password)
+        if self.db:
+            await self._send('SELECT', self.db)
+
+    async def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected Redis reply: {line!r}")
+
+    async def command(self, *args):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    # Reconnect once after a dropped connection
+                    self._close_connection()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # A command cut short, e.g. cancelled mid-reply, leaves its
+                    # reply unread; the next command must not read it
+                    self._close_connection()
+                    raise
+
+    def _close_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, call_sid):
+        value = await self.command('GET', self.prefix + call_sid)
+        return codec.loads(value) if value else None
+
+    async def put(self, call_sid, record, ttl):
+        await self.command('SET', self.prefix + call_sid, codec.dumps(record), 'EX', max(1, int(ttl)))
+
+    async def update(self, call_sid, fields):
+        record = await self.get(call_sid)
+        if record is None:
+            return False
+        record.update(fields)
+        # XX: only if the key still exists; KEEPTTL (Redis 6+): keep its expiry
+        reply = await self.command('SET', self.prefix + call_sid, codec.dumps(record), 'XX', 'KEEPTTL')
+        return reply == 'OK'
+
+    async def delete(self, call_sid):
+        await self.command('DEL', self.prefix + call_sid)
+
+    async def count(self):
+        cursor, total = '0', 0
+        while True:
+            cursor, keys = await self.command('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            total += len(keys)
+            if cursor == '0':
+                return total
+
+    async def close(self):
+        async with self._lock:
+            self._close_connection()
+
+
+def create_backend(spec=SESSION_BACKEND):
+    if spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('sqlite:///'):
+        return SQLiteBackend(spec[len('sqlite:///'):])
+    if spec.startswith(('redis://', 'rediss://')):
+        if spec.startswith('rediss://'):
+            raise ValueError("TLS Redis URLs (rediss://) are not supported")
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown SESSION_BACKEND: {spec}")
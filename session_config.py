@@ -0,0 +1,137 @@
+# session.update messages for the OpenAI Realtime API.
+#
+# The instructions are a template with per-call placeholders ({now},
+# {caller_number}); everything else in the session (audio formats, tools,
+# voice) is static. Each persona serializes its session once, with the
+# template's literal text already JSON-escaped, so building the message for a
+# call only escapes the placeholder values and joins strings.
+#
+# Pooled sessions are configured with the default persona when they connect,
+# which may be minutes before a call takes them. At stream start the call
+# sends call_update(): the instructions with the current time and the
+# caller's number, plus the voice when the call uses another persona (the
+# voice can still change until the model first speaks).
+#
+# Personas are registered with register_persona(name, instructions, voice) and
+# selected per call with /incoming-call?persona=<name>.
+import datetime
+import json
+import logging
+import string
+
+import tools
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERSONA = 'default'
+
+PERSONAS = {}
+
+# Stands in for the instructions while the static part is serialized
+_PLACEHOLDER = '\x00instructions\x00'
+
+
+def _escape(text):
+    # Body of a JSON string literal
+    return json.dumps(text)[1:-1]
+
+
+def current_time():
+    return datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _Template:
+    def __init__(self, text):
+        # (escaped literal text, placeholder name or None)
+        self.parts = [(_escape(literal), field or None)
+                      for literal, field, _, _ in string.Formatter().parse(text)]
+        self.fields = {field for _, field in self.parts if field}
+
+    def render(self, values):
+        chunks = []
+        for literal, field in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(_escape(str(values.get(field, ''))))
+        return ''.join(chunks)
+
+
+class Persona:
+    def __init__(self, name, instructions, voice, temperature=0.8):
+        self.name = name
+        self.voice = voice
+        self.temperature = temperature
+        self.template = _Template(instructions)
+        self._session = None
+        self._call = None
+        self._call_with_voice = None
+
+    def _split(self, message):
+        prefix, suffix = json.dumps(message).split(json.dumps(_PLACEHOLDER))
+        # The instructions are spliced in as a string literal
+        return prefix + '"', '"' + suffix
+
+    def _compile(self):
+        # Deferred to first use, so tools registered after import are included
+        self._session = self._split({
+            "type": "session.update",
+            "session": {
+                "turn_detection": {"type": "server_vad"},
+                "input_audio_format": "g711_ulaw",
+                "output_audio_format": "g711_ulaw",
+                "voice": self.voice,
+                "instructions": _PLACEHOLDER,
+                "modalities": ["text", "audio"],
+                "temperature": self.temperature,
+                "input_audio_transcription": {
+                    "model": "whisper-1"
+                },
+                "tools": tools.schemas(),
+                "tool_choice": "auto"
+            }
+        })
+        self._call = self._split({"type": "session.update", "session": {"instructions": _PLACEHOLDER}})
+        self._call_with_voice = self._split({
+            "type": "session.update",
+            "session": {"voice": self.voice, "temperature": self.temperature, "instructions": _PLACEHOLDER}
+        })
+
+    def session_update(self, values):
+        if self._session is None:
+            self._compile()
+        prefix, suffix = self._session
+        return prefix + self.template.render(values) + suffix
+
+    def call_update(self, values, with_voice=False):
+        if self._session is None:
+            self._compile()
+        prefix, suffix = self._call_with_voice if with_voice else self._call
+        return prefix + self.template.render(values) + suffix
+
+
+def register_persona(name, instructions, voice, temperature=0.8):
+    persona = PERSONAS[name] = Persona(name, instructions, voice, temperature)
+    return persona
+
+
+def get_persona(name=None):
+    persona = PERSONAS.get(name or DEFAULT_PERSONA)
+    if persona is None:
+        logger.warning('Unknown persona %s, using %s', name, DEFAULT_PERSONA)
+        persona = PERSONAS[DEFAULT_PERSONA]
+    return persona
+
+
+def _values(caller_number):
+    return {"now": current_time(), "caller_number": caller_number or 'Unknown'}
+
+
+def session_update(persona=None, caller_number=None):
+    # The full session, as sent when a Realtime socket connects
+    return get_persona(persona).session_update(_values(caller_number))
+
+
+def call_update(persona=None, caller_number=None):
+    # Refreshes a pooled default-persona session for one call
+    selected = get_persona(persona)
+    return selected.call_update(_values(caller_number), with_voice=selected.name != DEFAULT_PERSONA)
@@ -0,0 +1,191 @@
+# Registry of call sessions keyed by Twilio CallSid.
+#
+# /incoming-call creates the session and the media stream attaches to it when
+# Twilio's start event names the CallSid. Sessions that never get a media
+# stream, or whose stream went away, are evicted after SESSION_IDLE_TIMEOUT;
+# every session is dropped after SESSION_TTL, and the registry never holds
+# more than SESSION_MAX_ENTRIES (least recently used go first).
+#
+# The registry only covers this process. /incoming-call also publishes each
+# session to the configured session backend so that a media stream arriving
+# on another worker or node can pick it up.
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from session_backends import create_backend
+from transcript import Transcript
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = float(os.getenv('SESSION_TTL', 4 * 3600))
+SESSION_IDLE_TIMEOUT = float(os.getenv('SESSION_IDLE_TIMEOUT', 300))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000))
+# Minimum seconds between full expiry sweeps
+SWEEP_INTERVAL = 10
+# Identifies this process in published records
+NODE_ID = os.getenv('NODE_ID', f"{os.uname().nodename}:{os.getpid()}")
+
+
+class CallSession:
+    __slots__ = ('call_sid', 'stream_sid', 'caller_number', 'call_details', 'first_message',
+                 'transcript', 'created_at', 'last_seen', 'active')
+
+    def __init__(self, call_sid, caller_number='Unknown', call_details=None):
+        now = time.monotonic()
+        self.call_sid = call_sid
+        self.stream_sid = None
+        self.caller_number = caller_number
+        self.call_details = call_details or {}
+        self.first_message = None
+        self.transcript = Transcript(call_sid)
+        self.created_at = now
+        self.last_seen = now
+        self.active = False
+
+    def memory_bytes(self):
+        size = sys.getsizeof(self) + self.transcript.memory_bytes() + sys.getsizeof(self.call_details)
+        for key, value in self.call_details.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+        for value in (self.call_sid, self.stream_sid, self.caller_number, self.first_message):
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+    def to_record(self):
+        return {
+            "callerNumber": self.caller_number,
+            "callDetails": self.call_details,
+            "firstMessage": self.first_message,
+            "node": NODE_ID
+        }
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, idle_timeout=SESSION_IDLE_TIMEOUT, max_entries=SESSION_MAX_ENTRIES, backend=None):
+        self.backend = backend or create_backend()
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.local_attaches = 0
+        self.remote_attaches = 0
+        self.unknown_attaches = 0
+
+    def create(self, call_sid, caller_number='Unknown', call_details=None):
+        self._maybe_sweep()
+        session = CallSession(call_sid, caller_number, call_details)
+        self._sessions[call_sid] = session
+        self._sessions.move_to_end(call_sid)
+        self.created += 1
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, call_sid):
+        session = self._sessions.get(call_sid)
+        if session is None:
+            return None
+        if self._is_expired(session, time.monotonic()):
+            del self._sessions[call_sid]
+            self.expired += 1
+            return None
+        return session
+
+    # Make the session visible to media streams on other workers and nodes
+    async def publish(self, session):
+        await self.backend.put(session.call_sid, session.to_record(), self.idle_timeout)
+
+    # Bind the media stream to the session created at /incoming-call, looking
+    # in the shared backend when it was created by another process, or start a
+    # new one if it is unknown (e.g. it already expired)
+    async def attach(self, call_sid, stream_sid, caller_number='Unknown'):
+        session = self.get(call_sid)
+        if session is not None:
+            self.local_attaches += 1
+        else:
+            record = None
+            if self.backend.shared:
+                try:
+                    record = await self.backend.get(call_sid)
+                except Exception as e:
+                    logger.error('Error reading session %s from backend: %s', call_sid, e)
+            if record:
+                self.remote_attaches += 1
+                session = self.create(call_sid, record.get('callerNumber', caller_number), record.get('callDetails'))
+                session.first_message = record.get('firstMessage')
+                logger.info('Session %s created on %s, attached on %s', call_sid, record.get('node'), NODE_ID)
+            else:
+                self.unknown_attaches += 1
+                session = self.create(call_sid, caller_number)
+        session.stream_sid = stream_sid
+        session.active = True
+        self.touch(session)
+        return session
+
+    def touch(self, session):
+        session.last_seen = time.monotonic()
+        if session.call_sid in self._sessions:
+            self._sessions.move_to_end(session.call_sid)
+
+    def pop(self, call_sid):
+        return self._sessions.pop(call_sid, None)
+
+    # Forget the session here and in the shared backend once the call ends
+    async def release(self, call_sid):
+        session = self.pop(call_sid)
+        try:
+            await self.backend.delete(call_sid)
+        except Exception as e:
+            logger.error('Error removing session %s from backend: %s', call_sid, e)
+        return session
+
+    async def stats(self):
+        self._maybe_sweep()
+        try:
+            published = await self.backend.count()
+        except Exception as e:
+            logger.error('Error counting sessions in backend: %s', e)
+            published = None
+        return {
+            "node": NODE_ID,
+            "backend": type(self.backend).__name__,
+            "published": published,
+            "localAttaches": self.local_attaches,
+            "remoteAttaches": self.remote_attaches,
+            "unknownAttaches": self.unknown_attaches,
+            "live": len(self._sessions),
+            "active": sum(1 for session in self._sessions.values() if session.active),
+            "maxEntries": self.max_entries,
+            "memoryBytes": sum(session.memory_bytes() for session in self._sessions.values()),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+    def _is_expired(self, session, now):
+        if now - session.created_at > self.ttl:
+            return True
+        return not session.active and now - session.last_seen > self.idle_timeout
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for call_sid in [sid for sid, session in self._sessions.items() if self._is_expired(session, now)]:
+            del self._sessions[call_sid]
+            self.expired += 1
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+session_store = SessionStore()
@@ -0,0 +1,37 @@
+# A SQLite database used from the event loop.
+#
+# sqlite3 calls block, so each database has one connection that is only used
+# from one dedicated thread. WAL journaling lets the processes on one machine
+# share the file without blocking readers.
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SQLiteDatabase:
+    def __init__(self, path, schema, thread_name_prefix='sqlite'):
+        self.path = path
+        # Statements run once when the connection is opened
+        self.schema = schema
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name_prefix)
+        self._db = None
+
+    def connect(self):
+        # Only call from functions passed to run()
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.schema:
+                self._db.execute(statement)
+        return self._db
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def close(self):
+        if self._db is not None:
+            await self.run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
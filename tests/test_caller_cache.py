@@ -0,0 +1,83 @@
+# A delivered transcript refreshes the caller's cached greeting without
+# making their next call wait on the route "1" webhook.
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caller_cache import CallerCache  # noqa: E402
+from delivery import DeliveryQueue  # noqa: E402
+
+NUMBER = "+15550100"
+
+
+class FakeN8N:
+    def __init__(self, fail_route_1=False):
+        self.fail_route_1 = fail_route_1
+        self.route_1 = 0
+        self.transcripts = []
+
+    async def fetch(self, caller_number):
+        # Stands in for fetch_caller_context
+        self.route_1 += 1
+        await asyncio.sleep(0.05)
+        if self.fail_route_1 and self.route_1 > 1:
+            return None
+        return {"firstMessage": f"Hello {caller_number}, greeting {self.route_1}"}
+
+    async def post(self, payload, _headers=None):
+        # Stands in for the webhook client used by the delivery spool
+        self.transcripts.append(payload)
+        return SimpleNamespace(ok=True, status_code=200)
+
+
+async def call_and_hang_up(tmp_path, n8n):
+    cache = CallerCache(fetch=n8n.fetch)
+    queue = DeliveryQueue(str(tmp_path / "spool.db"), workers=1, client=n8n)
+    queue.on_delivered("2", lambda payload: cache.revalidate(payload.get('number')))
+    await queue.start()
+    try:
+        # First call: nothing cached, the greeting comes from route "1"
+        assert cache.get(NUMBER) is None
+        first = await cache.load(NUMBER)
+        await asyncio.sleep(0)
+        # Hang-up: the transcript goes out on route "2"
+        await queue.enqueue({"route": "2", "number": NUMBER, "data": "User: hello\n"}, "CA1:transcript")
+        for _ in range(100):
+            if queue.sent:
+                break
+            await asyncio.sleep(0.01)
+        assert [payload["number"] for payload in n8n.transcripts] == [NUMBER]
+    finally:
+        await queue.stop()
+    return cache, first
+
+
+def test_repeat_call_after_delivered_transcript_is_served_from_cache(tmp_path):
+    async def scenario():
+        n8n = FakeN8N()
+        cache, first = await call_and_hang_up(tmp_path, n8n)
+        # Second call: answered from the cache at once
+        assert cache.get(NUMBER) == first
+        assert cache.stats()["misses"] == 1
+        # The refresh the delivery started replaces the entry for later calls
+        await asyncio.sleep(0.1)
+        assert n8n.route_1 == 2
+        assert cache.get(NUMBER)["firstMessage"].endswith("greeting 2")
+
+    asyncio.run(scenario())
+
+
+def test_failed_refresh_keeps_serving_the_stale_entry(tmp_path):
+    async def scenario():
+        n8n = FakeN8N(fail_route_1=True)
+        cache, first = await call_and_hang_up(tmp_path, n8n)
+        await asyncio.sleep(0.1)
+        # Still served, and still stale, so the next lookup tries again
+        assert cache.get(NUMBER) == first
+        assert cache.stats()["staleHits"] == 1
+        assert cache.stats()["inFlight"] == 1
+
+    asyncio.run(scenario())
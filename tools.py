@@ -0,0 +1,281 @@
+# Function tools the agent can call during a call.
+#
+# Each tool declares its JSON schema, an async handler and a timeout. The
+# session.update tool list is built from the registry, and a ToolRunner per
+# call runs every function call as its own task, so audio and events keep
+# flowing while a tool is pending. A tool that overruns its timeout gets the
+# standard apology instead of freezing the call.
+#
+# While a tool with filler=True is pending, the call's FillerPlayer covers the
+# silence; it is stopped before the result is sent.
+#
+# To add a tool, decorate an async handler(context, args) with @tool(...).
+# It returns a ToolResult; context carries the call's CallSid, caller number
+# and session.
+import asyncio
+import json
+import logging
+import time
+
+import websockets
+
+import codec
+import rag
+from answer_cache import answer_cache
+from metrics import TOOL_DURATION, Counter
+from webhooks import webhook_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_TIMEOUT = 10
+ERROR_INSTRUCTIONS = "I apologize, but I'm having trouble processing your request right now. Is there anything else I can help you with?"
+
+TOOL_TIMEOUTS = Counter('tool_call_timeouts_total', 'Function calls that overran their timeout', ['tool'])
+TOOL_ERRORS = Counter('tool_call_errors_total', 'Function calls that failed', ['tool'])
+
+TOOLS = {}
+_schemas = None
+
+
+class Tool:
+    def __init__(self, name, description, parameters, handler, timeout=DEFAULT_TOOL_TIMEOUT, cancel_on_barge_in=False,
+                 filler=True):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.handler = handler
+        self.timeout = timeout
+        # Drop the call when the caller starts speaking again
+        self.cancel_on_barge_in = cancel_on_barge_in
+        # Play filler audio while the call is pending
+        self.filler = filler
+
+    def schema(self):
+        return {"type": "function", "name": self.name, "description": self.description, "parameters": self.parameters}
+
+
+class ToolResult:
+    __slots__ = ('output', 'instructions')
+
+    def __init__(self, output, instructions=None):
+        self.output = output
+        # Instructions for the response.create that follows the output
+        self.instructions = instructions
+
+
+class CallContext:
+    __slots__ = ('call_sid', 'caller_number', 'session')
+
+    def __init__(self, call_sid=None, caller_number='Unknown', session=None):
+        self.call_sid = call_sid
+        self.caller_number = caller_number
+        self.session = session
+
+
+def register(tool):
+    global _schemas
+    TOOLS[tool.name] = tool
+    _schemas = None
+    return tool
+
+
+def tool(name, description, parameters, timeout=DEFAULT_TOOL_TIMEOUT, cancel_on_barge_in=False, filler=True):
+    def decorator(handler):
+        register(Tool(name, description, parameters, handler, timeout, cancel_on_barge_in, filler))
+        return handler
+    return decorator
+
+
+def schemas():
+    # Built once; register tools before the first session.update is sent
+    global _schemas
+    if _schemas is None:
+        _schemas = [registered.schema() for registered in TOOLS.values()]
+    return _schemas
+
+
+class ToolRunner:
+    def __init__(self, openai_ws, context, filler=None):
+        self.openai_ws = openai_ws
+        self.context = context
+        self.filler = filler
+        self._pending = {}
+
+    @property
+    def pending(self):
+        return bool(self._pending)
+
+    def start(self, name, call_id, arguments):
+        registered = TOOLS.get(name)
+        task = asyncio.create_task(self._run(registered, name, call_id, arguments))
+        self._pending[task] = registered
+        task.add_done_callback(self._done)
+        if self.filler is not None and registered is not None and registered.filler:
+            self.filler.start()
+        return task
+
+    def _done(self, task):
+        self._pending.pop(task, None)
+        if task.cancelled() or task.exception() is None:
+            return
+        if isinstance(task.exception(), websockets.ConnectionClosed):
+            # The call ended while the tool was running
+            logger.debug('Tool result dropped, OpenAI session closed')
+        else:
+            logger.error('Error finishing tool call: %s', task.exception())
+
+    async def _run(self, registered, name, call_id, arguments):
+        if registered is None:
+            logger.warning('Model called unknown tool %s', name)
+            await self._send_error()
+            return
+        started = time.monotonic()
+        try:
+            args = codec.loads(arguments or '{}')
+            result = await asyncio.wait_for(registered.handler(self.context, args), registered.timeout)
+        except asyncio.CancelledError:
+            logger.debug('Tool call %s cancelled', name)
+            await self._stop_filler()
+            raise
+        except asyncio.TimeoutError:
+            TOOL_TIMEOUTS.labels(tool=name).inc()
+            logger.warning('Tool call %s timed out after %ss', name, registered.timeout)
+            await self._stop_filler()
+            await self._send_error()
+        except Exception as e:
+            TOOL_ERRORS.labels(tool=name).inc()
+            logger.error('Error in tool call %s: %s', name, e)
+            await self._stop_filler()
+            await self._send_error()
+        else:
+            await self._stop_filler()
+            await self._send_result(call_id, result)
+        finally:
+            TOOL_DURATION.labels(tool=name).observe(time.monotonic() - started)
+
+    async def _stop_filler(self):
+        # Keep the filler going while another filler tool is still pending
+        if self.filler is None:
+            return
+        current = asyncio.current_task()
+        if not any(task is not current and registered is not None and registered.filler
+                   for task, registered in self._pending.items()):
+            await self.filler.stop()
+
+    async def _send_result(self, call_id, result):
+        await self.openai_ws.send(codec.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "call_id": call_id,
+                "output": result.output
+            }
+        }))
+        response = {"modalities": ["text", "audio"]}
+        if result.instructions:
+            response["instructions"] = result.instructions
+        await self.openai_ws.send(codec.dumps({"type": "response.create", "response": response}))
+
+    async def _send_error(self):
+        await self.openai_ws.send(codec.dumps({
+            "type": "response.create",
+            "response": {
+                "modalities": ["text", "audio"],
+                "instructions": ERROR_INSTRUCTIONS
+            }
+        }))
+
+    def barge_in(self):
+        # Cancel the calls whose answer is moot once the caller speaks again
+        cancelled = 0
+        for task, registered in list(self._pending.items()):
+            if registered is not None and registered.cancel_on_barge_in:
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def cancel_all(self):
+        for task in list(self._pending):
+            task.cancel()
+
+
+@tool(
+    "question_and_answer",
+    "Get answers to customer questions especially about AI employees",
+    {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"}
+        },
+        "required": ["question"]
+    },
+    timeout=15,
+    cancel_on_barge_in=True
+)
+async def question_and_answer(_context, args):
+    question = args.get('question')
+    # Serve repeated questions from the cache, otherwise ask the shared
+    # Pinecone Assistant off the event loop
+    answer_message = answer_cache.get(question)
+    if answer_message is None:
+        answer_message = await rag.answer_question(question)
+        if answer_message:
+            answer_cache.put(question, answer_message)
+    else:
+        logger.info('Answer served from cache for question: %s', question)
+    return ToolResult(
+        answer_message,
+        f"Respond to the user's question \"{question}\" based on this information: {answer_message}. Be concise and friendly."
+    )
+
+
+# Calendar IDs for each location
+calendars = {
+    "LOCATION1": "CALENDAR_EMAIL1",
+    "LOCATION2": "CALENDAR_EMAIL2",
+    "LOCATION3": "CALENDAR_EMAIL3",
+    # Add more locations as needed
+}
+
+
+@tool(
+    "schedule_meeting",
+    "Schedule a meeting for a customer. Returns a message indicating whether the booking was successful or not.",
+    {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "email": {"type": "string"},
+            "purpose": {"type": "string"},
+            "datetime": {"type": "string"},
+            "location": {"type": "string"}
+        },
+        "required": ["name", "email", "purpose", "datetime", "location"]
+    },
+    # Covers the route "3" webhook timeouts
+    timeout=20
+)
+async def schedule_meeting(context, args):
+    location = args.get('location')  # The user's selected location
+    # Select the correct calendar based on location
+    calendar_id = calendars.get(location)
+    if not calendar_id:
+        raise ValueError(f"Invalid location: {location}")
+    data = json.dumps({
+        "name": args.get('name'),
+        "email": args.get('email'),
+        "purpose": args.get('purpose'),
+        "datetime": args.get('datetime'),
+        "calendar_id": calendar_id
+    })
+
+    response = await webhook_client.post({
+        "route": "3",
+        "number": context.caller_number,
+        "data": data
+    })
+    if not response.ok:
+        raise Exception(f"Webhook request failed: {response.status_code}")
+    parsed_response = json.loads(response.text)
+    booking_message = parsed_response.get('message', "I'm sorry, I couldn't schedule the meeting at this time.")
+    return ToolResult(booking_message, booking_message)
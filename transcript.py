@@ -0,0 +1,108 @@
+# Append-only call transcript.
+#
+# Each turn is stored as an entry with its timestamp, speaker and turn latency,
+# and the text sent to N8N is joined once when it is needed. When
+# TRANSCRIPT_SPOOL_DIR is set, entries are also appended to
+# <dir>/<CallSid>.jsonl in chunks during the call, so the transcript survives
+# a crash before hang-up.
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_SPOOL_DIR = os.getenv('TRANSCRIPT_SPOOL_DIR')
+# Number of new entries that triggers a spool flush
+TRANSCRIPT_SPOOL_CHUNK = int(os.getenv('TRANSCRIPT_SPOOL_CHUNK', 4))
+
+
+class TranscriptEntry:
+    __slots__ = ('timestamp', 'speaker', 'text', 'latency_ms')
+
+    def __init__(self, speaker, text, latency_ms=None):
+        self.timestamp = time.time()
+        self.speaker = speaker
+        self.text = text
+        self.latency_ms = latency_ms
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "speaker": self.speaker,
+            "text": self.text,
+            "latencyMs": self.latency_ms
+        }
+
+
+class Transcript:
+    def __init__(self, call_sid=None, spool_dir=TRANSCRIPT_SPOOL_DIR):
+        self.call_sid = call_sid
+        self.spool_dir = spool_dir
+        self.entries = []
+        self._rendered = None
+        self._spooled = 0
+        self._flushing = None
+
+    def add(self, speaker, text, latency_ms=None):
+        self.entries.append(TranscriptEntry(speaker, text, latency_ms))
+        self._rendered = None
+        if self.spool_dir and len(self.entries) - self._spooled >= TRANSCRIPT_SPOOL_CHUNK:
+            self.flush()
+
+    def render(self):
+        if self._rendered is None:
+            self._rendered = "".join([f"{entry.speaker}: {entry.text}\n" for entry in self.entries])
+        return self._rendered
+
+    def to_list(self):
+        return [entry.to_dict() for entry in self.entries]
+
+    # Append entries not yet spooled to the spool file on a worker thread
+    def flush(self):
+        if not self.spool_dir or self._spooled == len(self.entries):
+            return self._flushing
+        chunk = self.entries[self._spooled:]
+        self._spooled = len(self.entries)
+        previous = self._flushing
+        self._flushing = asyncio.ensure_future(self._write_chunk(previous, chunk))
+        return self._flushing
+
+    async def close(self):
+        flushing = self.flush()
+        if flushing:
+            await flushing
+        if self.spool_dir:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.spool_path())
+
+    def spool_path(self):
+        return os.path.join(self.spool_dir, f"{self.call_sid or 'unknown'}.jsonl")
+
+    def memory_bytes(self):
+        size = sys.getsizeof(self.entries)
+        for entry in self.entries:
+            size += sys.getsizeof(entry) + sys.getsizeof(entry.text)
+        return size
+
+    async def _write_chunk(self, previous, chunk):
+        # Keep chunks in order on disk
+        if previous:
+            await previous
+        lines = "".join([json.dumps(entry.to_dict()) + "\n" for entry in chunk])
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._append, lines)
+        except Exception as e:
+            logger.error('Error spooling transcript for %s: %s', self.call_sid, e)
+
+    def _append(self, lines):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(self.spool_path(), 'a', encoding='utf-8') as spool:
+            spool.write(lines)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,64 @@
+# Shared async client for every call to the N8N webhook.
+#
+# requests is blocking, so each POST runs on a dedicated thread pool and is
+# awaited from the event loop. A single requests.Session keeps connections to
+# N8N alive between calls, and a semaphore bounds how many requests are in
+# flight so a slow N8N instance cannot pile up unbounded work.
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import WEBHOOK_ERRORS, WEBHOOK_LATENCY
+
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 16))
+
+# (connect, read) timeouts in seconds for each N8N route
+ROUTE_TIMEOUTS = {
+    "1": (2, 4),    # First message lookup - the caller is waiting for the greeting
+    "2": (3, 30),   # Transcript upload at the end of the call
+    "3": (3, 15),   # Meeting booking - the caller is waiting on the line
+}
+DEFAULT_TIMEOUT = (3, 15)
+
+
+class WebhookClient:
+    def __init__(self, url, max_concurrency=WEBHOOK_MAX_CONCURRENCY):
+        self.url = url
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='webhook')
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({"Content-Type": "application/json"})
+
+    async def post(self, payload, headers=None):
+        route = payload.get('route')
+        timeout = ROUTE_TIMEOUTS.get(route, DEFAULT_TIMEOUT)
+        request = functools.partial(self._session.post, self.url, json=payload, headers=headers, timeout=timeout)
+        started = time.monotonic()
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(self._executor, request)
+        except Exception:
+            WEBHOOK_ERRORS.labels(route=route).inc()
+            raise
+        finally:
+            WEBHOOK_LATENCY.labels(route=route).observe(time.monotonic() - started)
+        if not response.ok:
+            WEBHOOK_ERRORS.labels(route=route).inc()
+        return response
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+
+
+webhook_client = WebhookClient(N8N_WEBHOOK_URL)